@@ -0,0 +1,308 @@
+"""
+Data loaders of the district map layers, shared by all pages and sessions, and their background warm-up.
+On the first run of any page start_layer_warmup() builds the layers of every year range selectable on the districts page on a thread pool,
+so user requests find the shared caches filled. Requires generator/ on sys.path (set by the pages).
+"""
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from folium.plugins import HeatMap
+import os
+import queue
+import threading
+
+from listings_table import load_listings_table, open_listings_table, load_district_borders, sample_listings
+from polygon_store import open_polygon_store, store_group, lod_for_zoom
+from phoenixmap_service import create_phoenixmap_service, get_phoenix_map
+from profiling import profiled_loader, env_profiler
+from map_layers import PALETTES, cached_layer, cached_group_features, polygon_features, point_features, polygon_layer, point_layer
+
+dir_path = os.path.dirname(__file__) + "/"
+
+# Years selectable on the districts page
+YEARS = list(range(2009, 2022))
+# Initial map view of the districts page
+DEFAULT_MAP_VIEW = {"center": [48.8586, 2.389002], "zoom": 12.5}
+# Number of warm-up threads, can be set by environment variable, 0 disables the warm-up
+WARMUP_WORKERS = int(os.environ.get("PHOENIXMAP_WARMUP_WORKERS", 2))
+
+@st.cache_resource(show_spinner=False)
+@profiled_loader("load_polygon_store")
+def load_polygon_store():
+       """
+       Opens the binary polygon store written by the generator (memory-mapped).
+       Function is cached using st.cache_resource().
+
+       Returns
+       ----------
+       dict
+              Polygon store (see generator/polygon_store.py)
+       """
+       return open_polygon_store(os.path.join(dir_path, "ressources/"))
+
+@st.cache_resource(show_spinner=False)
+@profiled_loader("load_phoenixmap_service")
+def load_phoenixmap_service():
+       """
+       Creates the Phoenixmap service generating polygons for arbitrary year ranges on demand, shared across all sessions. 
+       Pregenerated polygons of the polygon store are served without generation.
+       Function is cached using st.cache_resource().
+
+       Returns
+       ----------
+       dict
+              Phoenixmap service (see generator/phoenixmap_service.py)
+       """
+       borders = load_district_borders(os.path.join(dir_path, "ressources/district_borders.json"))
+       return create_phoenixmap_service(load_listings(), borders, load_polygon_store(), profiler=env_profiler())
+
+@profiled_loader("load_district_polygons")
+def load_district_polygons(lower_year, upper_year, palette, lod):
+       """
+       Loads districts Phoenixmap polygons for year range defined by lower_year, upper_year in the colors of the palette.
+       Polygons of year ranges which were not pregenerated are generated on demand.
+       Polygon data is cached in the shared layer cache (see map_layers.py).
+
+       Parameters
+       ----------
+       lower_year : int
+              Minimum year of listings incorporated into calculation of Phoenixmaps
+       upper_year : int
+              Maximum year of listings incorporated into calculation of Phoenixmaps
+       palette: str
+              Name of the color palette for the districts (see map_layers.PALETTES)
+       lod: int
+              Level of detail tier of the polygons (see generator/polygon_store.py)
+
+       Returns
+       ----------
+       folium.GeoJson
+              Layer of all district polygons to plot on map via .add_to(folium_map)
+       """
+       def build():
+              # Get polygons sorted alphabetically
+              service = load_phoenixmap_service()
+              districts = sorted(service["borders"].keys())
+              district_polygons = [(district, get_phoenix_map(service, district, lower_year, upper_year, lod=lod)) for district in districts]
+              return polygon_features(district_polygons, PALETTES[palette])
+
+       return polygon_layer(cached_layer(("district_polygons", lower_year, upper_year, palette, lod), build), fill_opacity=0.7)
+
+@profiled_loader("load_tooltip_polygons")
+def load_tooltip_polygons(palette, lod):
+       """
+       Loads districts Phoenixmap polygons for districts with respective district-name as tooltip in the (semi-transparent) colors of the palette.
+       Polygon data is cached in the shared layer cache (see map_layers.py).
+
+       Parameters
+       ----------
+       palette: str
+              Name of the color palette for the districts (see map_layers.PALETTES)
+       lod: int
+              Level of detail tier of the district borders (see generator/polygon_store.py)
+
+       Returns
+       ----------
+       folium.GeoJson
+              Layer of all district borders to plot on map via .add_to(folium_map)
+       """
+       # District borders of the polygon store, sorted alphabetically
+       features = cached_layer(("district_borders", palette, lod), lambda: polygon_features(store_group(load_polygon_store(), "district_borders", lod), PALETTES[palette]))
+
+       return polygon_layer(features, fill_opacity=0.1, tooltip=True)
+
+
+@profiled_loader("load_district_heatmaps")
+def load_district_heatmaps(lower_year, upper_year):
+       """
+       Loads districts Heatmaps for 1000 sampled listings per district in year range defined by lower_year, upper_year.
+       Sampled listings are cached in the shared layer cache (see map_layers.py).
+
+       Parameters
+       ----------
+       lower_year : int
+              Minimum host year of listings
+       upper_year : int
+              Maximum host year of listings
+
+       Returns
+       ----------
+       list(folium.plugins.HeatMap)
+              List of Heatmaps to plot on map via .add_to(folium_map)
+       """
+       heatmaps = []
+       for district in load_listings_sample(lower_year, upper_year, 1000):
+              heatmaps.append(HeatMap(district, radius=13, max_zoom=14, blur=14))
+       return heatmaps
+
+@profiled_loader("load_circle_markers")
+def load_circle_markers(lower_year, upper_year, palette):
+       """
+       Loads CircleMarkers for 20 sampled listings per district in year range defined by lower_year, upper_year.
+       Marker data is cached in the shared layer cache (see map_layers.py).
+
+       Parameters
+       ----------
+       lower_year : int
+              Minimum host year of listings
+       upper_year : int
+              Maximum host year of listings
+       palette: str
+              Name of the color palette for the districts (see map_layers.PALETTES)
+
+       Returns
+       ----------
+       folium.GeoJson
+              Layer of all listings drawn as CircleMarkers to plot on map via .add_to(folium_map)
+       """
+       def build():
+              districts = sorted(load_listings()["districts"])
+              return point_features(zip(districts, load_listings_sample(lower_year, upper_year, 20)), PALETTES[palette])
+
+       return point_layer(cached_layer(("circle_markers", lower_year, upper_year, palette), build), radius=2)
+
+@st.cache_resource(show_spinner=False)
+@profiled_loader("load_listings")
+def load_listings():
+       """
+       Loads district listings table bucketed by district and host year. Uses the listings store written by the generator, 
+       falls back to parsing district_listings.json.
+       Function is cached using st.cache_resource().
+
+       Returns
+       ----------
+       dict
+              Listings table (see generator/listings_table.py)
+       """
+       store_dir = os.path.join(dir_path, "ressources/listings_store")
+       if os.path.exists(store_dir):
+              return open_listings_table(store_dir)
+       return load_listings_table(os.path.join(dir_path, "ressources/district_listings.json"))
+
+@profiled_loader("load_listings_sample")
+def load_listings_sample(lower_year, upper_year, sample_size):
+       """
+       Loads sample-sized district listing locations for year range defined by lower_year, upper_year.
+       Samples are seeded (see listings_table.sample_listings()), so all sessions get the same sample, and cached in the shared layer cache (see map_layers.py).
+
+       Parameters
+       ----------
+       lower_year : int
+              Minimum year of listings incorporated into calculation of Phoenixmaps
+       upper_year : int
+              Maximum year of listings incorporated into calculation of Phoenixmaps
+       sample_size: int
+              Size of sample
+
+
+       Returns
+       ----------
+       list(list(tuple(float, float)))
+              List of list of district listings coordinates
+       """
+       def build():
+              listings = load_listings()
+              districts = sorted(listings["districts"])
+
+              # Sample rows of the year range slice of every district
+              return [sample_listings(listings, district, lower_year, upper_year, sample_size).tolist() for district in districts]
+
+       return cached_layer(("listings_sample", lower_year, upper_year, sample_size), build)
+
+def _warm_year_range(lower_year, upper_year, palette, lods):
+       # Level of detail 0 first, coarser tiers are simplified from it
+       for lod in lods:
+              load_district_polygons(lower_year, upper_year, palette, lod)
+       load_circle_markers(lower_year, upper_year, palette)
+       load_listings_sample(lower_year, upper_year, 1000)
+
+def layer_warmup_tasks(palette):
+       """
+       Lists the warm-up tasks of all layers selectable on the districts page and the Bourse pages, the default view first.
+
+       Parameters
+       ----------
+       palette: str
+              Name of the color palette (see map_layers.PALETTES)
+
+       Returns
+       ----------
+       list(tuple(str, callable))
+              Name and function without arguments per task
+       """
+       store = load_polygon_store()
+       lods = list(range(len(store["lod_tolerances"]) + 1))
+       default_lod = lod_for_zoom(DEFAULT_MAP_VIEW["zoom"], DEFAULT_MAP_VIEW["center"][0])
+       tasks = [("default_view", lambda: (load_district_polygons(YEARS[0], YEARS[-1], palette, default_lod), load_tooltip_polygons(palette, default_lod)))]
+       tasks += [("district_borders_lod_{}".format(lod), lambda lod=lod: load_tooltip_polygons(palette, lod)) for lod in lods]
+       tasks += [(group, lambda group=group: cached_group_features(os.path.join(dir_path, "ressources/"), group, palette)) for group in ["polygons_bourse_year_convex_hull", "polygons_bourse_year_district_borders"]]
+
+       # Every slider combination (the page swaps reversed ranges), pregenerated year ranges are cheap and come first
+       year_ranges = [(lower_year, upper_year) for lower_year in YEARS for upper_year in YEARS if lower_year <= upper_year]
+       pregenerated = {key.split("/")[0] for key in store["polygons"].keys()}
+       year_ranges.sort(key=lambda year_range: "polygons_{}_{}".format(*year_range) not in pregenerated)
+       tasks += [("years_{}_{}".format(lower_year, upper_year), lambda lower_year=lower_year, upper_year=upper_year: _warm_year_range(lower_year, upper_year, palette, lods)) for lower_year, upper_year in year_ranges]
+       return tasks
+
+def _run_warmup_worker(status, tasks, ctx):
+       # Cached loaders look up the script run context, attach the one of the starting session
+       add_script_run_ctx(threading.current_thread(), ctx)
+       while True:
+              try:
+                     name, task = tasks.get_nowait()
+              except queue.Empty:
+                     return
+              try:
+                     task()
+              except Exception as error:
+                     with status["lock"]:
+                            status["errors"].append((name, repr(error)))
+              with status["lock"]:
+                     status["done"] += 1
+
+@st.cache_resource(show_spinner=False)
+def start_layer_warmup(palette):
+       """
+       Starts the background warm-up of all map layers (see layer_warmup_tasks()) once per process and returns immediately.
+       The warm-up fills the shared caches (st.cache_resource, phoenixmap service, map_layers layer cache) that all sessions read from.
+       Warm-up threads are daemon threads, so they do not delay the shutdown of the server.
+       Function is cached using st.cache_resource().
+
+       Parameters
+       ----------
+       palette: str
+              Name of the color palette (see map_layers.PALETTES)
+
+       Returns
+       ----------
+       dict
+              Warm-up status, pass to layer_warmup_status()
+       """
+       status = {"total": 0, "done": 0, "errors": [], "lock": threading.Lock()}
+       if WARMUP_WORKERS <= 0:
+              return status
+       tasks = queue.Queue()
+       for task in layer_warmup_tasks(palette):
+              tasks.put(task)
+       status["total"] = tasks.qsize()
+
+       ctx = get_script_run_ctx()
+       for i in range(WARMUP_WORKERS):
+              threading.Thread(target=_run_warmup_worker, args=(status, tasks, ctx), name="layer_warmup_{}".format(i), daemon=True).start()
+       return status
+
+def layer_warmup_status(status):
+       """
+       Returns the progress of the background warm-up.
+
+       Parameters
+       ----------
+       status: dict
+              Warm-up status as returned by start_layer_warmup()
+
+       Returns
+       ----------
+       dict
+              Number of finished ("done") and all ("total") tasks, failed tasks ("errors", list of task name and error) and "ready" once all tasks finished
+       """
+       with status["lock"]:
+              return {"done": status["done"], "total": status["total"], "errors": list(status["errors"]), "ready": status["done"] == status["total"]}
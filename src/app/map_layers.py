@@ -0,0 +1,183 @@
+"""
+Builds map layers as GeoJSON FeatureCollections with data-driven styling. All polygons (or points) of a layer are serialized as one folium.GeoJson,
+styled per feature by its "color" property, instead of one folium object per polygon or marker.
+Layer data is kept in a process wide, size bounded LRU cache shared by all pages and sessions (see cached_layer()).
+Requires generator/ on sys.path (set by the pages).
+"""
+from cachetools import LRUCache
+import folium
+
+import json
+import os
+import threading
+
+from polygon_store import open_polygon_store, store_group
+
+# Color palettes by name, layers are cached by palette name instead of color lists
+PALETTES = {
+       "districts": ['blue', 'red', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow', 'black', 'gray', 'pink', 'brown', 'lime', 'olive', 'teal', 'navy', 'salmon', 'gold', 'indigo', 'turquoise'],
+}
+
+# Size bound of the layer cache in MB of serialized layer data, can be set by environment variable
+LAYER_CACHE_MB = float(os.environ.get("PHOENIXMAP_LAYER_CACHE_MB", 256))
+
+# Entries are (layer data, serialized size) tuples, the size is computed once per layer
+_layer_cache = {"cache": LRUCache(maxsize=LAYER_CACHE_MB * 1024 * 1024, getsizeof=lambda entry: entry[1]), "lock": threading.Lock()}
+
+
+def cached_layer(key, build):
+       """
+       Returns layer data from the shared layer cache, builds and caches it on a miss. Least recently used layers are evicted once
+       the serialized size of all cached layers exceeds LAYER_CACHE_MB, layers larger than LAYER_CACHE_MB are returned without caching.
+
+       Parameters
+       ----------
+       key: tuple
+              Cheap, hashable key identifying the layer, e.g. ("district_polygons", 2009, 2021, "districts", 0)
+       build: callable
+              Function without arguments building the layer data (json serializable)
+
+       Returns
+       ----------
+       object
+              Layer data
+       """
+       with _layer_cache["lock"]:
+              entry = _layer_cache["cache"].get(key)
+       if entry is not None:
+              return entry[0]
+       value = build()
+       size = len(json.dumps(value))
+       with _layer_cache["lock"]:
+              # LRUCache raises ValueError for single values larger than the cache
+              if size <= _layer_cache["cache"].maxsize:
+                     _layer_cache["cache"][key] = (value, size)
+       return value
+
+def layer_cache_info():
+       """
+       Returns statistics of the shared layer cache.
+
+       Returns
+       ----------
+       dict
+              Number of cached layers ("layers"), their serialized size ("bytes") and the size bound ("max_bytes")
+       """
+       with _layer_cache["lock"]:
+              return {"layers": len(_layer_cache["cache"]), "bytes": _layer_cache["cache"].currsize, "max_bytes": _layer_cache["cache"].maxsize}
+
+def polygon_features(named_polygons, colors):
+       """
+       Converts polygons into a GeoJSON FeatureCollection.
+
+       Parameters
+       ----------
+       named_polygons: list(tuple(str, np.ndarray | None))
+              Name and (N, 2) array of (latitude, longitude) coordinates per polygon, polygons which are None are skipped
+       colors: list(str)
+              Color per polygon
+
+       Returns
+       ----------
+       dict
+              FeatureCollection with properties "name" and "color" per feature (name is also the feature id, so folium does not modify cached features)
+       """
+       features = []
+       for (name, polygon), color in zip(named_polygons, colors):
+              if polygon is not None:
+                     # GeoJSON coordinates are (longitude, latitude)
+                     ring = [[float(longitude), float(latitude)] for latitude, longitude in polygon]
+                     features.append({"type": "Feature", "id": str(name), "geometry": {"type": "Polygon", "coordinates": [ring]}, "properties": {"name": str(name), "color": color}})
+       return {"type": "FeatureCollection", "features": features}
+
+def point_features(named_points, colors):
+       """
+       Converts point groups into a GeoJSON FeatureCollection with one MultiPoint feature per group.
+
+       Parameters
+       ----------
+       named_points: list(tuple(str, list(tuple(float, float))))
+              Name and list of (latitude, longitude) coordinates per group
+       colors: list(str)
+              Color per group
+
+       Returns
+       ----------
+       dict
+              FeatureCollection with properties "name" and "color" per feature (name is also the feature id, so folium does not modify cached features)
+       """
+       features = []
+       for (name, group_points), color in zip(named_points, colors):
+              coordinates = [[float(longitude), float(latitude)] for latitude, longitude in group_points]
+              features.append({"type": "Feature", "id": str(name), "geometry": {"type": "MultiPoint", "coordinates": coordinates}, "properties": {"name": str(name), "color": color}})
+       return {"type": "FeatureCollection", "features": features}
+
+def polygon_layer(features, fill_opacity, weight=0, tooltip=False):
+       """
+       Creates a single folium layer for a polygon FeatureCollection, filled in the color of each feature.
+
+       Parameters
+       ----------
+       features: dict
+              FeatureCollection as returned by polygon_features()
+       fill_opacity: float
+              Fill opacity of the polygons
+       weight: float
+              Outline width of the polygons, 0 draws no outline
+       tooltip: bool
+              If True show the feature name as tooltip
+
+       Returns
+       ----------
+       folium.GeoJson
+              Layer to plot on map via .add_to(folium_map)
+       """
+       return folium.GeoJson(
+              features,
+              style_function=lambda feature: {"fillColor": feature["properties"]["color"], "color": feature["properties"]["color"], "fillOpacity": fill_opacity, "weight": weight, "stroke": weight > 0},
+              tooltip=folium.GeoJsonTooltip(fields=["name"], labels=False) if tooltip else None,
+              control=False,
+       )
+
+def point_layer(features, radius):
+       """
+       Creates a single folium layer for a point FeatureCollection, drawn as circle markers in the color of each feature.
+
+       Parameters
+       ----------
+       features: dict
+              FeatureCollection as returned by point_features()
+       radius: float
+              Radius of the circle markers in pixels
+
+       Returns
+       ----------
+       folium.GeoJson
+              Layer to plot on map via .add_to(folium_map)
+       """
+       return folium.GeoJson(
+              features,
+              style_function=lambda feature: {"color": feature["properties"]["color"]},
+              marker=folium.CircleMarker(radius=radius),
+              control=False,
+       )
+
+def cached_group_features(output_path, group, palette):
+       """
+       Loads the polygons of a polygon store group (e.g. Bourse years) as GeoJSON features through the shared layer cache.
+
+       Parameters
+       ----------
+       output_path: str
+              Directory of the polygon store
+       group: str
+              Group name, e.g. "polygons_bourse_year_convex_hull"
+       palette: str
+              Name of the color palette (see PALETTES)
+
+       Returns
+       ----------
+       list(dict)
+              GeoJSON features (property "name" is the polygon name within the group)
+       """
+       return cached_layer(("group_polygons", group, palette), lambda: polygon_features(store_group(open_polygon_store(output_path), group), PALETTES[palette])["features"])
@@ -5,43 +5,35 @@ import streamlit as st
 from streamlit_folium import st_folium
 from st_pages import Page, show_pages
 import os
+import sys
 import folium
-import json
 
 dir_path = os.path.dirname(__file__) + "/"
-colors = ['blue', 'red', 'green', 'orange', 'purple', 'cyan', 'magenta', 'yellow', 'black', 'gray', 'pink', 'brown', 'lime', 'olive', 'teal', 'navy', 'salmon', 'gold', 'indigo', 'turquoise']
+sys.path.append(os.path.join(dir_path, "../generator"))
+from profiling import profiled_loader, write_env_profile
+from map_layers import cached_group_features, polygon_layer
+from district_layers import start_layer_warmup
+palette = "districts"
 
-def load_year_polygons(colors):
+@profiled_loader("load_year_polygons")
+def load_year_polygons(palette):
        """
-       Loads Phoenixmap polygon (from district border) for year range saved in folder (2009-2021).
-       Function is NOT cached using st.cache_resource() to avoid reload problems.
+       Loads Phoenixmap polygon (from district border) for years saved in polygon store (2010-2020).
+       Function is NOT cached using st.cache_resource() to avoid reload problems, polygon data is cached in the shared layer cache (see map_layers.py).
 
        Parameters
        ----------
-       colors: list(str)
-              List of colors for the districts
+       palette: str
+              Name of the color palette for the years (see map_layers.PALETTES)
 
        Returns
        ----------
-       list(folium.Polygon)
-              List of polygons to plot on map via .add_to(folium_map)
+       list(dict)
+              GeoJSON features of the year polygons (property "name" is the year), to plot selected years via map_layers.polygon_layer()
        """
-       # Get files
-       polygon_dir = os.path.join(dir_path, "ressources/polygons_bourse_year_district_borders/")
-       polygon_dir_files = os.listdir(polygon_dir)
-       polygon_dir_files.sort()
 
-       year_polygons = []
-       for i, (dir_file) in enumerate(polygon_dir_files):
-              if (dir_file).endswith(".json"):
-                     polygon_file = os.path.join(polygon_dir, (dir_file))
-                     # Open files, create polygons
-                     with open(polygon_file) as file:
-                            polygon_data = json.load(file)
-                            folium_polygon = folium.Polygon(locations=polygon_data, color=None, fill_color=colors[i], fill=True, fill_opacity=0.7, tooltip=dir_file[:-5])
-                            year_polygons.append(folium_polygon)
-
-       return year_polygons
+       # Get polygons sorted by year from polygon store
+       return cached_group_features(os.path.join(dir_path, "ressources/"), "polygons_bourse_year_district_borders", palette)
 
 st.set_page_config(
     page_title="Bourse by year (from district border)",
@@ -56,6 +48,7 @@ show_pages(
         Page(os.path.join(dir_path, "page_bourse_district_borders.py"), "Bourse by year (from district border)", "🔎"),
     ]
 )
+start_layer_warmup(palette)
 
 col_1, col_2 = st.columns([1,5], gap="medium")
 with col_1:
@@ -75,10 +68,13 @@ with col_2:
     map = folium.Map(location=[48.86736, 2.358002], zoom_start=15.2)
     folium.TileLayer('cartodbpositron', control=False).add_to(map)
     
-    year_polygons = load_year_polygons(colors)
-    for i, (polygon) in enumerate(year_polygons):
-            if years_to_show[i]:
-                polygon.add_to(map)
-                    
+    # Selected years as a single layer
+    year_polygons = load_year_polygons(palette)
+    selected_years = [str(year) for year, show in zip(range(2010, 2022), years_to_show) if show]
+    selected_polygons = {"type": "FeatureCollection", "features": [feature for feature in year_polygons if feature["properties"]["name"] in selected_years]}
+    polygon_layer(selected_polygons, fill_opacity=0.7, tooltip=True).add_to(map)
+
     st_folium(map, width=2000, height=920)
 
+write_env_profile()
+
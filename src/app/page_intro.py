@@ -3,10 +3,13 @@ Streamlit page with brief project intro and explainer graphic.
 """
 import streamlit as st
 import os
+import sys
 from PIL import Image
 from st_pages import Page, show_pages
 
 dir_path = os.path.dirname(__file__) + "/"
+sys.path.append(os.path.join(dir_path, "../generator"))
+from district_layers import start_layer_warmup
 
 st.set_page_config(
     page_title="Explainer",
@@ -22,6 +25,9 @@ show_pages(
     ]
 )
 
+# Entry page of the app, start precomputing the map layers of the other pages in the background
+start_layer_warmup("districts")
+
 st.title("Phoenixmap")
 
 st.write("This demo is an implementation of a 2D spatial distribution visualization based on \"Phoenixmap\" [1]. \
@@ -0,0 +1,284 @@
+"""
+Benchmark of the Phoenixmap generator on synthetic district workloads (transformed real district borders, clustered listings).
+Times every pipeline stage and the district build of setup_and_generate(), results are written as json so they can be compared across versions.
+"""
+from shapely import *
+
+import numpy as np
+import scipy
+import shapely
+
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from phoenixmap_generator import DEFAULT_PARAMETERS, build_listing_index, phoenix_hull_polygon, fit_bspline_segments, fit_segment_circles, build_segment_rectangles, compute_segment_densities, compute_projection_densities, average_segment_densities, build_phoenix_outline, generate_district_polygons
+from listings_table import bucket_listings_by_year, load_district_borders
+
+# Radius inscribed circles collapse to if none fits (min_radius of fit_inscribed_circles(), shrink_inscribed_circles())
+MIN_CIRCLE_RADIUS = 0.0000005
+
+# Year ranges generated per district by setup_and_generate()
+BENCHMARK_YEAR_RANGES = [(2009, 2013), (2009, 2017), (2009, 2021), (2013, 2017), (2013, 2021), (2017, 2021), (2009, 2009), (2013, 2013), (2017, 2017), (2021, 2021)]
+
+def generate_border(rng, borders, num_vertices=200, scale_range=(0.8, 1.25)):
+    """
+    Generates a district border from a randomly chosen real district border, resampled along its perimeter, rotated and scaled around its center.
+
+    Parameters
+    ----------
+    rng: np.random.Generator
+            Random number generator
+    borders: dict(str, np.ndarray)
+            Real district border coordinates (see listings_table.load_district_borders())
+    num_vertices: int
+            Number of border vertices
+    scale_range: tuple(float, float)
+            Range of the random scale factor
+
+    Returns
+    ----------
+    tuple(np.ndarray, str)
+            (num_vertices, 2) border coordinates (latitude, longitude) and name of the district it was generated from
+    """
+    district = sorted(borders)[rng.integers(len(borders))]
+    border_ring = LinearRing(borders[district])
+    border = get_coordinates(line_interpolate_point(border_ring, np.linspace(0, 1, num_vertices, endpoint=False), normalized=True))
+    center = border.mean(axis=0)
+    angle = rng.uniform(0, 2 * math.pi)
+    rotation = np.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+    return center + (border - center) @ rotation.T * rng.uniform(*scale_range), district
+
+def generate_clustered_listings(rng, border, num_listings, num_clusters=8, cluster_spread=0.1, background_share=0.2, years=(2009, 2021)):
+    """
+    Generates listings inside a border, drawn from gaussian clusters plus a uniform background.
+
+    Parameters
+    ----------
+    rng: np.random.Generator
+            Random number generator
+    border: np.ndarray
+            (N, 2) border coordinates (see generate_border())
+    num_listings: int
+            Number of listings to generate
+    num_clusters: int
+            Number of gaussian clusters
+    cluster_spread: float
+            Standard deviation of the clusters relative to the border extent
+    background_share: float
+            Share of uniformly distributed listings
+    years: tuple(int, int)
+            Range of host years (inclusive)
+
+    Returns
+    ----------
+    tuple(np.ndarray, np.ndarray)
+            (num_listings, 2) listing coordinates and host years
+    """
+    border_polygon = Polygon(border)
+    prepare(border_polygon)
+    min_x, min_y, max_x, max_y = border_polygon.bounds
+    spread = cluster_spread * max(max_x - min_x, max_y - min_y)
+
+    def sample_inside(sample, count):
+        coords = np.zeros((0, 2))
+        while len(coords) < count:
+            candidates = sample(2 * (count - len(coords)) + 16)
+            candidates = candidates[contains_xy(border_polygon, candidates[:, 0], candidates[:, 1])]
+            coords = np.concatenate((coords, candidates))
+        return coords[:count]
+
+    def sample_uniform(count):
+        return np.column_stack((rng.uniform(min_x, max_x, count), rng.uniform(min_y, max_y, count)))
+
+    cluster_centers = sample_inside(sample_uniform, num_clusters)
+    def sample_clusters(count):
+        return cluster_centers[rng.integers(0, num_clusters, count)] + rng.normal(0, spread, (count, 2))
+
+    num_background = int(num_listings * background_share)
+    coords = np.concatenate((sample_inside(sample_uniform, num_background), sample_inside(sample_clusters, num_listings - num_background)))
+    coords = coords[rng.permutation(num_listings)]
+    return coords, rng.integers(years[0], years[1] + 1, num_listings).astype(np.int32)
+
+def measure(function, repeats):
+    """
+    Measures wall time and peak memory of a function. Memory is traced in a separate run, so tracing does not distort the timings.
+
+    Parameters
+    ----------
+    function: callable
+            Function without arguments
+    repeats: int
+            Number of timed runs
+
+    Returns
+    ----------
+    tuple(object, dict)
+            Result of the last run and measurements "seconds" (best run), "median_seconds" and "peak_traced_bytes" (python and numpy allocations)
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": min(times), "median_seconds": float(np.median(times)), "peak_traced_bytes": peak}
+
+def benchmark_stages(border, listing_coords, parameters, repeats):
+    """
+    Benchmarks the stages of generate_phoenix_map() (from district border) separately.
+
+    Parameters
+    ----------
+    border: np.ndarray
+            (N, 2) border coordinates
+    listing_coords: np.ndarray
+            (M, 2) listing coordinates
+    parameters: dict
+            Generation parameters scale, num_segments, wam_range, circle_shrink, circle_tolerance, wam_kernel
+    repeats: int
+            Number of timed runs per stage
+
+    Returns
+    ----------
+    dict
+            Measurements per stage (see measure()), stages with listing dependent work also report "listings_per_second",
+            "circle_fit" also reports the "median_radius" of the inscribed circles,
+            "density_projection" also reports "count_deviation" from the rectangle counts of "density_count"
+    """
+    stages = {}
+    hull_polygon, stages["hull"] = measure(lambda: phoenix_hull_polygon(True, 0, None, border), repeats)
+    segments, stages["spline_fit"] = measure(lambda: fit_bspline_segments(hull_polygon, parameters["num_segments"]), repeats)
+    (circle_radii, circle_centers), stages["circle_fit"] = measure(lambda: fit_segment_circles(segments, parameters["circle_shrink"], parameters["circle_tolerance"]), repeats)
+    rectangles, stages["rectangles"] = measure(lambda: build_segment_rectangles(segments["midpoints"], circle_centers), repeats)
+    # Borders collapsing most circles to the minimum radius would time the following stages on degenerate geometry
+    stages["circle_fit"]["median_radius"] = float(np.median(circle_radii))
+    assert stages["circle_fit"]["median_radius"] > 100 * MIN_CIRCLE_RADIUS, "inscribed circles of the benchmark border collapse to the minimum radius"
+    structure = dict(segments, circle_radii=circle_radii, circle_centers=circle_centers, rectangles=rectangles, rectangle_areas=area(rectangles))
+
+    listing_index, stages["listing_index"] = measure(lambda: build_listing_index(listing_coords), repeats)
+    rectangle_densities, stages["density_count"] = measure(lambda: compute_segment_densities(structure, listing_index), repeats)
+    projection_densities, stages["density_projection"] = measure(lambda: compute_projection_densities(structure, listing_coords), repeats)
+    # Deviation of projection counts from rectangle counts, relative to all counted listings
+    rectangle_counts = rectangle_densities * structure["rectangle_areas"]
+    stages["density_projection"]["count_deviation"] = float(np.abs(projection_densities * structure["rectangle_areas"] - rectangle_counts).sum() / max(rectangle_counts.sum(), 1))
+    wam_segment_densities, stages["wam"] = measure(lambda: average_segment_densities(rectangle_densities, structure["rectangle_areas"], parameters["wam_range"], parameters["wam_kernel"]), repeats)
+    _, stages["outline"] = measure(lambda: build_phoenix_outline(structure, wam_segment_densities, parameters["scale"]), repeats)
+
+    for stage in ["listing_index", "density_count", "density_projection"]:
+        stages[stage]["listings_per_second"] = len(listing_coords) / max(stages[stage]["seconds"], 1e-12)
+    return stages
+
+def benchmark_district_build(border, listing_coords, listing_years, parameters, repeats):
+    """
+    Benchmarks generate_district_polygons(), the per district task of setup_and_generate(), for all default year ranges.
+
+    Parameters
+    ----------
+    border: np.ndarray
+            (N, 2) border coordinates
+    listing_coords: np.ndarray
+            (M, 2) listing coordinates
+    listing_years: np.ndarray
+            Host year per listing
+    parameters: dict
+            Generation parameters scale, num_segments, wam_range, circle_shrink, circle_tolerance, wam_kernel
+    repeats: int
+            Number of timed runs
+
+    Returns
+    ----------
+    dict
+            Measurements (see measure()) with "polygons_per_second"
+    """
+    listings = bucket_listings_by_year(["Benchmark"], listing_coords[:, 0].copy(), listing_coords[:, 1].copy(), listing_years, np.array([0, len(listing_coords)], dtype=np.int64))
+    borders = {"Benchmark": border}
+    _, measurements = measure(lambda: generate_district_polygons(listings, borders, "Benchmark", BENCHMARK_YEAR_RANGES, parameters), repeats)
+    measurements["polygons_per_second"] = len(BENCHMARK_YEAR_RANGES) / max(measurements["seconds"], 1e-12)
+    return measurements
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes, repeats=3, seed=0, num_border_vertices=200, parameters=None):
+    """
+    Runs stage and district build benchmarks for synthetic workloads of different sizes.
+
+    Parameters
+    ----------
+    sizes: list(int)
+            Numbers of listings per workload
+    repeats: int
+            Number of timed runs per measurement
+    seed: int
+            Seed of the workload generators, equal seeds generate equal workloads
+    num_border_vertices: int
+            Number of vertices of the benchmark district border
+    parameters: dict
+            Generation parameters, missing entries use phoenixmap_generator.DEFAULT_PARAMETERS
+
+    Returns
+    ----------
+    dict
+            Benchmark report with keys "environment", "parameters", "workloads" and "max_rss_bytes" (peak resident memory of the process)
+    """
+    parameters = dict(DEFAULT_PARAMETERS, **(parameters or {}))
+    borders = load_district_borders(os.path.join(os.path.dirname(os.path.realpath(__file__)), "ressources/district_borders.json"))
+    workloads = []
+    for num_listings in sizes:
+        rng = np.random.default_rng(seed)
+        border, border_district = generate_border(rng, borders, num_border_vertices)
+        listing_coords, listing_years = generate_clustered_listings(rng, border, num_listings)
+        workloads.append({
+            "num_listings": num_listings,
+            "num_border_vertices": num_border_vertices,
+            "border_district": border_district,
+            "stages": benchmark_stages(border, listing_coords, parameters, repeats),
+            "district_build": benchmark_district_build(border, listing_coords, listing_years, parameters, repeats),
+        })
+        print("Benchmarked {} listings".format(num_listings), file=sys.stderr)
+
+    return {
+        "environment": {
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "shapely": shapely.__version__,
+            "seed": seed,
+            "repeats": repeats,
+        },
+        "parameters": parameters,
+        "workloads": workloads,
+        # ru_maxrss is reported in kilobytes on Linux
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Phoenixmap generator on synthetic district workloads.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="numbers of listings per workload")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per measurement (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the workload generators (default: 0)")
+    parser.add_argument("--output", help="json file to write the report to (default: stdout)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.repeats, args.seed)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
@@ -0,0 +1,113 @@
+"""
+Content-addressed build cache for generated Phoenixmap polygons. Every output file is keyed by a hash of its inputs, only outputs with changed keys are regenerated.
+"""
+import numpy as np
+
+import hashlib
+import json
+import os
+
+
+def hash_code_files(code_files):
+    """
+    Hashes the source files of the generator once per build, pass the result to compute_cache_key().
+
+    Parameters
+    ----------
+    code_files: list(str)
+            Source files of the generator, changing the algorithm invalidates all keys
+
+    Returns
+    ----------
+    str
+            Hex digest of the source files
+    """
+    digest = hashlib.sha256()
+    for code_file in code_files:
+        with open(code_file, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def compute_cache_key(listing_coords, border_coords, parameters, code_hash=""):
+    """
+    Computes the content-addressed key of a generated polygon.
+
+    Parameters
+    ----------
+    listing_coords: np.ndarray
+            (N, 2) array of listing coordinates the polygon is generated from
+    border_coords: np.ndarray
+            (M, 2) array of district border coordinates
+    parameters: tuple
+            Full parameter tuple passed to generate_phoenix_map()
+    code_hash: str
+            Hash of the generator source files (see hash_code_files())
+
+    Returns
+    ----------
+    str
+            Hex digest identifying the polygon
+    """
+    digest = hashlib.sha256()
+    for coords in [listing_coords, border_coords]:
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        digest.update(str(coords.shape).encode())
+        digest.update(coords.tobytes())
+    digest.update(repr(parameters).encode())
+    digest.update(code_hash.encode())
+    return digest.hexdigest()
+
+def load_manifest(manifest_file):
+    """
+    Loads the build manifest.
+
+    Parameters
+    ----------
+    manifest_file: str
+            Path to manifest json
+
+    Returns
+    ----------
+    dict(str, str)
+            Cache key per output file (relative to manifest directory), empty if there is no manifest yet
+    """
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as file:
+        return json.load(file)
+
+def save_manifest(manifest_file, manifest):
+    """
+    Saves the build manifest.
+
+    Parameters
+    ----------
+    manifest_file: str
+            Path to manifest json
+    manifest: dict(str, str)
+            Cache key per output file (relative to manifest directory)
+    """
+    with open(manifest_file, "w") as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+
+def is_stale(manifest, output_path, file_name, cache_key):
+    """
+    Checks if an output file has to be regenerated.
+
+    Parameters
+    ----------
+    manifest: dict(str, str)
+            Manifest of the last build
+    output_path: str
+            Directory the output files are written to
+    file_name: str
+            Output file (relative to output_path)
+    cache_key: str
+            Current cache key of the output
+
+    Returns
+    ----------
+    bool
+            True if the output is missing or was built from different inputs
+    """
+    return manifest.get(file_name) != cache_key or not os.path.exists(os.path.join(output_path, file_name))
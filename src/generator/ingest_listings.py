@@ -0,0 +1,121 @@
+"""
+Streaming ingestion of the Airbnb listings dump (Listings.csv) into the columnar listings store (see listings_table.open_listings_table()).
+Replaces the helper_scripts chain filter_listings.py -> split_neighbourhoods.py: the csv is read once in chunks, listings are spilled
+to one binary file per (district, host year) bucket and the buckets are copied into memory-mapped columns. Memory use is bounded by the chunk size.
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+import argparse
+import json
+import os
+import tempfile
+
+# Columns read from the listings csv
+CSV_COLUMNS = ["neighbourhood", "city", "host_since", "latitude", "longitude"]
+
+
+def _spill_chunk(chunk, city, districts, bucket_counts, spill_dir):
+    # Register districts in order of appearance, also if none of their listings has a host year (like split_neighbourhoods.py)
+    chunk = chunk[chunk["city"] == city]
+    for district in chunk["neighbourhood"].unique():
+        districts.setdefault(district, len(districts))
+
+    chunk = chunk.dropna(subset=["host_since", "latitude", "longitude"])
+    chunk = chunk[chunk["host_since"].str.len() >= 4]
+    years = pd.to_numeric(chunk["host_since"].str[:4], errors="coerce")
+    chunk = chunk.assign(year=years).dropna(subset=["year"])
+
+    for (district, year), bucket in chunk.groupby(["neighbourhood", "year"], sort=False):
+        year = int(year)
+        coords = np.ascontiguousarray(bucket[["latitude", "longitude"]].to_numpy(dtype=np.float64))
+        with open(os.path.join(spill_dir, "{}_{}.bin".format(districts[district], year)), "ab") as file:
+            coords.tofile(file)
+        bucket_counts[(districts[district], year)] = bucket_counts.get((districts[district], year), 0) + len(coords)
+
+def ingest_listings_csv(listings_file, store_dir, city="Paris", chunk_size=100000, encoding="utf-8-sig"):
+    """
+    Reads listings csv in chunks, keeps listings of a city with host year and writes them as listings store in one pass over the csv.
+
+    Parameters
+    ----------
+    listings_file: str
+            Path to listings csv (columns neighbourhood, city, host_since, latitude, longitude, further columns are skipped)
+    store_dir: str
+            Directory to write the listings store to (created if missing), open with listings_table.open_listings_table()
+    city: str
+            Only listings of this city are kept
+    chunk_size: int
+            Number of csv rows read per chunk, bounds memory use
+    encoding: str
+            Encoding of the csv
+
+    Returns
+    ----------
+    int
+            Number of ingested listings
+    """
+    districts = {}
+    bucket_counts = {}
+    with tempfile.TemporaryDirectory() as spill_dir:
+        # 1. Filter and parse chunks, spill listings per (district, host year) bucket
+        reader = pd.read_csv(listings_file, usecols=CSV_COLUMNS, dtype={"neighbourhood": str, "city": str, "host_since": str, "latitude": np.float64, "longitude": np.float64},
+                             float_precision="round_trip", chunksize=chunk_size, encoding=encoding)
+        for chunk in reader:
+            _spill_chunk(chunk, city, districts, bucket_counts, spill_dir)
+
+        # 2. Compute row offsets of districts and year buckets
+        bucket_years = sorted({year for _, year in bucket_counts.keys()})
+        first_year = bucket_years[0] if bucket_years else 0
+        num_years = bucket_years[-1] - first_year + 1 if bucket_years else 0
+        counts = np.zeros((len(districts), num_years), dtype=np.int64)
+        for (district_id, year), count in bucket_counts.items():
+            counts[district_id, year - first_year] = count
+        year_offsets = np.zeros((len(districts), num_years + 1), dtype=np.int64)
+        year_offsets[:, 1:] = np.cumsum(counts, axis=1)
+        offsets = np.zeros(len(districts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(year_offsets[:, -1])
+        year_offsets += offsets[:-1, np.newaxis]
+
+        # 3. Copy buckets into memory-mapped columns in blocks of chunk_size rows
+        os.makedirs(store_dir, exist_ok=True)
+        columns = {}
+        for column, dtype in [("latitudes", np.float64), ("longitudes", np.float64), ("years", np.int32)]:
+            columns[column] = open_memmap(os.path.join(store_dir, column + ".npy"), mode="w+", dtype=dtype, shape=(int(offsets[-1]),))
+        for district_id in range(len(districts)):
+            for k in range(num_years):
+                row = year_offsets[district_id, k]
+                columns["years"][row:year_offsets[district_id, k + 1]] = first_year + k
+                spill_file = os.path.join(spill_dir, "{}_{}.bin".format(district_id, first_year + k))
+                if not os.path.exists(spill_file):
+                    continue
+                with open(spill_file, "rb") as file:
+                    while True:
+                        coords = np.fromfile(file, dtype=np.float64, count=2 * chunk_size).reshape(-1, 2)
+                        if len(coords) == 0:
+                            break
+                        columns["latitudes"][row:row + len(coords)] = coords[:, 0]
+                        columns["longitudes"][row:row + len(coords)] = coords[:, 1]
+                        row += len(coords)
+        for column in columns.values():
+            column.flush()
+        del columns
+
+    np.save(os.path.join(store_dir, "year_offsets.npy"), year_offsets)
+    with open(os.path.join(store_dir, "index.json"), "w") as file:
+        json.dump({"districts": list(districts.keys()), "offsets": offsets.tolist(), "first_year": first_year}, file)
+    return int(offsets[-1])
+
+if __name__ == "__main__":
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(description="Ingest the listings csv into the listings store read by the generator.")
+    parser.add_argument("listings_file", help="listings csv, e.g. Listings.csv")
+    parser.add_argument("--output", default=os.path.join(dir_path, "ressources/listings_store"), help="listings store directory (default: generator/ressources/listings_store)")
+    parser.add_argument("--city", default="Paris", help="city to keep listings of (default: Paris)")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="csv rows per chunk (default: 100000)")
+    parser.add_argument("--encoding", default="utf-8-sig", help="encoding of the csv (default: utf-8-sig)")
+    args = parser.parse_args()
+
+    num_listings = ingest_listings_csv(args.listings_file, args.output, args.city, args.chunk_size, args.encoding)
+    print("Ingested {} listings into {}".format(num_listings, args.output))
@@ -0,0 +1,218 @@
+"""
+Loading stage for district listings and district borders. Source files are parsed once into columnar in-memory tables.
+Listings are bucketed by district and host year, so the listings of any year range are a contiguous slice.
+"""
+import numpy as np
+
+import json
+import os
+import zlib
+
+
+def load_listings_table(listings_file):
+    """
+    Loads district listings json once and converts it into a columnar table.
+    Listings of one district are stored contiguously, district i covers the rows offsets[i]:offsets[i+1].
+    Within a district listings are sorted by host year, year_offsets[i, k] is the first row of district i with host year >= first_year + k.
+
+    Parameters
+    ----------
+    listings_file: str
+            Path to district listings json ({district: [{"latitude", "longitude", "host_since"}, ...]})
+
+    Returns
+    ----------
+    dict
+            Table with keys "districts" (list(str)), "latitudes", "longitudes" (np.ndarray(float64)), "years" (np.ndarray(int32)), "offsets" (np.ndarray(int64)),
+            "first_year" (int) and "year_offsets" (np.ndarray(int64), shape (len(districts), num_years + 1))
+    """
+    with open(listings_file) as file:
+        data = json.load(file)
+
+    districts = list(data.keys())
+    counts = [len(data[district]) for district in districts]
+    offsets = np.zeros(len(districts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+
+    latitudes = np.empty(offsets[-1], dtype=np.float64)
+    longitudes = np.empty(offsets[-1], dtype=np.float64)
+    years = np.empty(offsets[-1], dtype=np.int32)
+    for i, district in enumerate(districts):
+        items = data[district]
+        start, end = offsets[i], offsets[i+1]
+        latitudes[start:end] = [item["latitude"] for item in items]
+        longitudes[start:end] = [item["longitude"] for item in items]
+        years[start:end] = [int(item["host_since"][:4]) for item in items]
+
+    return bucket_listings_by_year(districts, latitudes, longitudes, years, offsets)
+
+def bucket_listings_by_year(districts, latitudes, longitudes, years, offsets):
+    """
+    Sorts listings within each district by host year (stable) and computes the prefix offsets of the year buckets.
+
+    Parameters
+    ----------
+    districts: list(str)
+            Names of the districts
+    latitudes: np.ndarray
+            Listing latitudes, district i covers the rows offsets[i]:offsets[i+1]
+    longitudes: np.ndarray
+            Listing longitudes
+    years: np.ndarray
+            Listing host years
+    offsets: np.ndarray
+            Row offsets of the districts
+
+    Returns
+    ----------
+    dict
+            Listings table (see load_listings_table())
+    """
+    order = np.concatenate([start + np.argsort(years[start:end], kind="stable") for start, end in zip(offsets[:-1], offsets[1:])] + [np.zeros(0, dtype=np.int64)])
+    latitudes, longitudes, years = latitudes[order], longitudes[order], years[order]
+
+    first_year = int(years.min()) if len(years) > 0 else 0
+    last_year = int(years.max()) if len(years) > 0 else -1
+    bucket_years = np.arange(first_year, last_year + 2)
+    year_offsets = np.array([start + np.searchsorted(years[start:end], bucket_years, side="left") for start, end in zip(offsets[:-1], offsets[1:])], dtype=np.int64).reshape(len(districts), len(bucket_years))
+
+    return {"districts": districts, "latitudes": latitudes, "longitudes": longitudes, "years": years, "offsets": offsets, "first_year": first_year, "year_offsets": year_offsets}
+
+def year_range_rows(table, district, from_year, to_year):
+    """
+    Looks up the listings of a district with from_year <= host year <= to_year in O(1), without scanning or parsing.
+
+    Parameters
+    ----------
+    table: dict
+            Listings table as returned by load_listings_table()
+    district: str
+            Name of the district
+    from_year: int
+            Minimum host year
+    to_year: int
+            Maximum host year
+
+    Returns
+    ----------
+    tuple(int, int)
+            Rows start:end of the year range, relative to the district slice returned by district_listings()
+    """
+    i = table["districts"].index(district)
+    num_years = table["year_offsets"].shape[1] - 1
+    lower = min(max(from_year - table["first_year"], 0), num_years)
+    upper = max(min(max(to_year - table["first_year"] + 1, 0), num_years), lower)
+    return int(table["year_offsets"][i, lower] - table["offsets"][i]), int(table["year_offsets"][i, upper] - table["offsets"][i])
+
+def district_listings(table, district):
+    """
+    Slices the listings of a district out of a listings table (no copy).
+
+    Parameters
+    ----------
+    table: dict
+            Listings table as returned by load_listings_table()
+    district: str
+            Name of the district
+
+    Returns
+    ----------
+    tuple(np.ndarray, np.ndarray, np.ndarray)
+            Latitudes, longitudes and host years of the district listings
+    """
+    i = table["districts"].index(district)
+    start, end = table["offsets"][i], table["offsets"][i+1]
+    return table["latitudes"][start:end], table["longitudes"][start:end], table["years"][start:end]
+
+def sample_listings(table, district, from_year, to_year, sample_size, seed=0):
+    """
+    Draws a reproducible sample of the listings of a district with from_year <= host year <= to_year.
+    Rows are drawn by offset from the year range slice (see year_range_rows()), so only sampled listings are read.
+    Equal arguments return equal samples in every process and session.
+
+    Parameters
+    ----------
+    table: dict
+            Listings table as returned by load_listings_table()
+    district: str
+            Name of the district
+    from_year: int
+            Minimum host year
+    to_year: int
+            Maximum host year
+    sample_size: int
+            Size of sample, all listings of the year range are returned if there are fewer
+    seed: int
+            Base seed, combined with district, year range and sample size
+
+    Returns
+    ----------
+    np.ndarray
+            (sample_size, 2) array of sampled listing coordinates (latitude, longitude) in row order
+    """
+    latitudes, longitudes, _ = district_listings(table, district)
+    start, end = year_range_rows(table, district, from_year, to_year)
+
+    # Python's hash() of strings differs between processes, crc32 is stable
+    rng = np.random.default_rng([seed, zlib.crc32(district.encode("utf-8")), max(from_year, 0), max(to_year, 0), sample_size])
+    rows = start + np.sort(rng.choice(end - start, min(sample_size, end - start), replace=False))
+    return np.column_stack((latitudes[rows], longitudes[rows]))
+
+def load_district_borders(borders_file):
+    """
+    Loads district borders json once.
+
+    Parameters
+    ----------
+    borders_file: str
+            Path to district borders json ({district: [{"latitude", "longitude"}, ...]})
+
+    Returns
+    ----------
+    dict(str, np.ndarray)
+            District border coordinates as (N, 2) arrays of (latitude, longitude), in file order
+    """
+    with open(borders_file) as file:
+        data = json.load(file)
+
+    return {district: np.array([(item["latitude"], item["longitude"]) for item in items], dtype=np.float64).reshape(-1, 2) for district, items in data.items()}
+
+def save_listings_table(table, store_dir):
+    """
+    Saves a listings table as directory of .npy column files plus json index, which can be memory-mapped by open_listings_table().
+
+    Parameters
+    ----------
+    table: dict
+            Listings table as returned by load_listings_table()
+    store_dir: str
+            Directory to write the table to (created if missing)
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    for column in ["latitudes", "longitudes", "years", "year_offsets"]:
+        np.save(os.path.join(store_dir, column + ".npy"), table[column])
+    with open(os.path.join(store_dir, "index.json"), "w") as file:
+        json.dump({"districts": table["districts"], "offsets": table["offsets"].tolist(), "first_year": table["first_year"]}, file)
+
+def open_listings_table(store_dir, mmap_mode="r"):
+    """
+    Opens a listings table saved by save_listings_table(). Columns are memory-mapped, so processes opening the same store share its pages.
+
+    Parameters
+    ----------
+    store_dir: str
+            Directory the table was saved to
+    mmap_mode: str
+            Memory-map mode passed to np.load(), None loads columns into memory
+
+    Returns
+    ----------
+    dict
+            Listings table (see load_listings_table())
+    """
+    with open(os.path.join(store_dir, "index.json")) as file:
+        index = json.load(file)
+    table = {"districts": index["districts"], "offsets": np.array(index["offsets"], dtype=np.int64), "first_year": index["first_year"]}
+    for column in ["latitudes", "longitudes", "years", "year_offsets"]:
+        table[column] = np.load(os.path.join(store_dir, column + ".npy"), mmap_mode=mmap_mode)
+    return table
@@ -3,194 +3,736 @@ Implementation of algorithm to generate Phoenixmaps.
 """
 from shapely import *
 import scipy.interpolate as sci 
+from scipy.spatial import cKDTree
 from shapely.validation import make_valid
 
 import numpy as np
 import math
 
+import argparse
 import csv
 import json
 import os
-import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 
 import matplotlib.pyplot as plt
 import matplotlib.patches as pltp
 
-def generate_phoenix_map(district_borders, buffer_size, num_segments, averaging_range, density_scale, circle_step_shrink_factor, listing_points, border_points):
+from listings_table import load_listings_table, district_listings, year_range_rows, load_district_borders, save_listings_table, open_listings_table
+from build_cache import hash_code_files, compute_cache_key, load_manifest, save_manifest, is_stale
+from polygon_store import write_polygon_store
+from profiling import profile_stage, record_count, merge_profile_events, create_profiler, profile_summary, write_chrome_trace, write_profile_log
+
+# Generation parameters of the district Phoenixmaps served by the app
+DEFAULT_PARAMETERS = {
+    "scale": 0.0000000001,
+    "num_segments": 100,
+    "wam_range": 10,
+    "circle_shrink": 0.80,
+    "circle_tolerance": None,
+    "wam_kernel": "box",
+    "density_mode": "rectangles",
+    "segmentation": "uniform",
+    "segment_tolerance": None,
+}
+
+# Weighting kernels of the moving average over segments, weight per offset (relative to the window center) and averaging range
+AVERAGING_KERNELS = {
+    "box": lambda offsets, averaging_range: np.ones(len(offsets)),
+    "triangular": lambda offsets, averaging_range: 1 - np.abs(offsets) / averaging_range,
+    "gaussian": lambda offsets, averaging_range: np.exp(-0.5 * (offsets / (0.5 * averaging_range)) ** 2),
+}
+
+def build_listing_index(listing_coords):
     """
-    Generates Phoenixmap with specified parameters from specified listings.
+    Builds a spatial index (STRtree) over listing points. Build once per district and reuse it for all year ranges and parameter variants.
+
+    Parameters
+    ----------
+    listing_coords: np.ndarray
+            (N, 2) array of listing coordinates
+
+    Returns
+    ----------
+    shapely.STRtree
+            Spatial index over the listing points, geometry i corresponds to listing_coords[i]
+    """
+    return STRtree(points(np.asarray(listing_coords, dtype=np.float64).reshape(-1, 2)))
+
+def count_points_in_polygons(polygons, listing_index, listing_selection=None):
+    """
+    Counts indexed points inside each polygon in a single batched index query (same semantics as Point.within(polygon)).
+    Only candidate points in the bounding box of a polygon are tested.
+
+    Parameters
+    ----------
+    polygons: np.ndarray(shapely.Polygon)
+            Polygons to count points in
+    listing_index: shapely.STRtree
+            Spatial index over the points as returned by build_listing_index()
+    listing_selection: np.ndarray(bool) | slice
+            Optional mask or range over the indexed points, only selected points are counted
+
+    Returns
+    ----------
+    np.ndarray(int)
+            Number of points inside each polygon
+    """
+    polygon_ids, point_ids = listing_index.query(polygons, predicate="contains")
+    if isinstance(listing_selection, slice):
+        polygon_ids = polygon_ids[(listing_selection.start <= point_ids) & (point_ids < listing_selection.stop)]
+    elif listing_selection is not None:
+        polygon_ids = polygon_ids[listing_selection[point_ids]]
+    return np.bincount(polygon_ids, minlength=len(polygons))
+
+def fit_inscribed_circles(bspline_polygon, midpoints, directions, max_radii, tolerance, min_radius=0.0000005, profiler=None):
+    """
+    Computes maximal inscribed circle radii by bisection on the radius, for all segments at once.
+    A circle with center midpoint + direction * radius fits if its center lies inside the polygon and its distance to the polygon boundary, plus the distance of 
+    a midpoint outside the polygon to the boundary, is at least the radius of the circle polygonised as in shrink_inscribed_circles().
+
+    Parameters
+    ----------
+    bspline_polygon: shapely.Polygon
+            Polygon the circles have to fit into
+    midpoints: np.ndarray
+            (N, 2) array of segment midpoints the circles touch
+    directions: np.ndarray
+            (N, 2) array of normalized vectors pointing from the midpoints to the circle centers
+    max_radii: np.ndarray
+            Upper bounds for the circle radii
+    tolerance: float
+            Maximum deviation of the computed radii from the maximal fitting radii
+    min_radius: float
+            Radius used if no circle fits
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()), records bisection iterations and circle checks
+
+    Returns
+    ----------
+    tuple(np.ndarray, np.ndarray)
+            Circle radii and (N, 2) array of circle centers
+    """
+    boundary = bspline_polygon.exterior
+    prepare(bspline_polygon)
+    # Midpoints on convex stretches of the B-Spline lie outside the polygon through the segment ends, circles touching them may cross its boundary by that offset
+    offsets = np.where(contains_xy(bspline_polygon, midpoints[:, 0], midpoints[:, 1]), 0, distance(boundary, points(midpoints)))
+    # Circles polygonised with 8 segments per quadrant only reach the circle at their vertices
+    polygonised_radius = math.cos(math.pi / 32)
+
+    def fits(radii, ids):
+        centers = midpoints[ids] + directions[ids] * radii[:, np.newaxis]
+        return contains_xy(bspline_polygon, centers[:, 0], centers[:, 1]) & (distance(boundary, points(centers)) + offsets[ids] >= radii * polygonised_radius)
+
+    radii = np.array(max_radii, dtype=np.float64)
+    lower_radii = np.zeros_like(radii)
+    upper_radii = radii.copy()
+
+    # Bisect radius of circles not fitting with their upper bound
+    unfit_ids = np.flatnonzero(~fits(radii, np.arange(len(radii))))
+    ids = unfit_ids[upper_radii[unfit_ids] > tolerance]
+    num_iterations, num_checks = 0, len(radii)
+    while len(ids) > 0:
+        num_iterations, num_checks = num_iterations + 1, num_checks + len(ids)
+        middle_radii = (lower_radii[ids] + upper_radii[ids]) / 2
+        fitting = fits(middle_radii, ids)
+        lower_radii[ids[fitting]] = middle_radii[fitting]
+        upper_radii[ids[~fitting]] = middle_radii[~fitting]
+        ids = ids[(upper_radii[ids] - lower_radii[ids]) > tolerance]
+
+    radii[unfit_ids] = np.maximum(lower_radii[unfit_ids], min_radius)
+    record_count(profiler, "circle_bisection_iterations", num_iterations)
+    record_count(profiler, "circle_checks", num_checks)
+    return radii, midpoints + directions * radii[:, np.newaxis]
+
+def shrink_inscribed_circles(bspline_polygon, midpoints, directions, max_radii, circle_step_shrink_factor, min_radius=0.0000005, profiler=None):
+    """
+    Computes inscribed circle radii by shrinking the radius until the circle fits, for all segments at once.
+    Circles are constructed like minimum_bounding_circle() of midpoint and midpoint + direction * 2 * radius and tested against the prepared polygon in batches.
+
+    Parameters
+    ----------
+    bspline_polygon: shapely.Polygon
+            Polygon the circles have to fit into
+    midpoints: np.ndarray
+            (N, 2) array of segment midpoints the circles touch
+    directions: np.ndarray
+            (N, 2) array of normalized vectors pointing from the midpoints to the circle centers
+    max_radii: np.ndarray
+            Initial circle radii
+    circle_step_shrink_factor: float
+            Shrinking of inscribed circle per iteration
+    min_radius: float
+            Circles with smaller radius are accepted without test
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()), records shrink iterations
+
+    Returns
+    ----------
+    tuple(np.ndarray, np.ndarray)
+            Circle radii and (N, 2) array of circle centers
+    """
+    prepare(bspline_polygon)
+    radii = np.array(max_radii, dtype=np.float64)
+
+    num_shrink_iterations = 0
+    ids = np.arange(len(radii))
+    while len(ids) > 0:
+        # Minimum bounding circle of the two points: center between them, 8 segments per quadrant
+        circle_bounds = midpoints[ids] + directions[ids] * radii[ids, np.newaxis] * 2
+        bounding_centers = (midpoints[ids] + circle_bounds) / 2
+        bounding_radii = np.hypot(bounding_centers[:, 0] - midpoints[ids, 0], bounding_centers[:, 1] - midpoints[ids, 1])
+        circles = buffer(points(bounding_centers), bounding_radii, quad_segs=8)
+
+        # Check if circles fit inside B-Spline curve, decrease radius of the others
+        fitting = contains(bspline_polygon, circles) | (radii[ids] < min_radius)
+        ids = ids[~fitting]
+        radii[ids] = radii[ids] * circle_step_shrink_factor
+        num_shrink_iterations += len(ids)
+
+    record_count(profiler, "circle_shrink_iterations", num_shrink_iterations)
+    return radii, midpoints + directions * radii[:, np.newaxis]
+
+def _segment_intersection(start_1, end_1, start_2, end_2):
+    direction_1 = (end_1[0] - start_1[0], end_1[1] - start_1[1])
+    direction_2 = (end_2[0] - start_2[0], end_2[1] - start_2[1])
+    denominator = direction_1[0] * direction_2[1] - direction_1[1] * direction_2[0]
+    if denominator == 0:
+        return None
+    offset = (start_2[0] - start_1[0], start_2[1] - start_1[1])
+    t = (offset[0] * direction_2[1] - offset[1] * direction_2[0]) / denominator
+    u = (offset[0] * direction_1[1] - offset[1] * direction_1[0]) / denominator
+    if 0 <= t <= 1 and 0 <= u <= 1:
+        return (start_1[0] + t * direction_1[0], start_1[1] + t * direction_1[1])
+    return None
+
+def remove_outline_loops(outline):
+    """
+    Removes loops (self-intersections) from a closed outline in O(n log n).
+    Intersecting segment pairs are found with a spatial index over all segments, the outline is then traversed once: 
+    if a segment crosses earlier segments, the ring after the first crossed segment is cut off and split into loops without crossings at the crossings. 
+    The closing segment splits the remaining ring the same way. The largest of all loops is returned, areas are computed with prefix sums of the shoelace terms.
+
+    Parameters
+    ----------
+    outline: np.ndarray
+            (N, 2) array of outline vertices (without repeated closing vertex)
+
+    Returns
+    ----------
+    list(tuple(float, float))
+            Closed ring without loops
+    """
+    # Drop repeated vertices
+    outline = np.asarray(outline, dtype=np.float64).reshape(-1, 2)
+    repeated = np.all(outline == np.roll(outline, 1, axis=0), axis=1)
+    outline = outline[~repeated] if not repeated.all() else outline[:1]
+    num_points = len(outline)
+    if num_points < 4:
+        return [tuple(point) for point in outline] + [tuple(outline[0])]
+
+    # Candidate pairs (earlier segment, later segment) of intersecting non-adjacent segments, segment i runs from point i to point i+1
+    segments = linestrings(np.stack((outline, np.roll(outline, -1, axis=0)), axis=1))
+    earlier_ids, later_ids = STRtree(segments).query(segments, predicate="intersects")
+    non_adjacent = (later_ids - earlier_ids > 1) & ~((earlier_ids == 0) & (later_ids == num_points - 1))
+    earlier_ids, later_ids = earlier_ids[non_adjacent], later_ids[non_adjacent]
+    candidates = {}
+    for later_id, earlier_id in sorted(zip(later_ids.tolist(), earlier_ids.tolist())):
+        candidates.setdefault(later_id, []).append(earlier_id)
+
+    # Twice the signed area of the triangle of the first vertex and a segment, summed along a ring to twice its signed area
+    origin = outline[0]
+    def shoelace(start, end):
+        return (start[0] - origin[0]) * (end[1] - origin[1]) - (start[1] - origin[1]) * (end[0] - origin[0])
+
+    # Crossings (ring index, intersection point) of a segment with the earlier segments still in the ring, ordered by segment
+    def ring_crossings(segment_id, start, end):
+        crossings = []
+        for i in candidates.get(segment_id, []):
+            k = positions.get(i)
+            if k is None or k >= len(segment_ids) or segment_ids[k] != i:
+                continue
+            intersection_point = _segment_intersection(ring[k], ring[k+1], start, end)
+            if intersection_point is not None:
+                crossings.append((k, intersection_point))
+        return crossings
+
+    # Splits the ring at the crossings of a segment starting at the last ring vertex into loops between crossings consecutive along the segment.
+    # Closed along the segment, these loops do not cross themselves, the largest one is kept. ring_areas[k] is twice the swept area of the ring up to ring[k]
+    largest_loop, largest_loop_area = None, -1
+    def keep_largest_loop(crossings):
+        nonlocal largest_loop, largest_loop_area
+        bounds = sorted(crossings, key=lambda bound: math.dist(bound[1], ring[-1]))
+        for (k_1, point_1), (k_2, point_2) in map(sorted, zip(bounds[:-1], bounds[1:])):
+            if k_1 == k_2:
+                continue
+            loop_area = abs(shoelace(point_1, ring[k_1+1]) + ring_areas[k_2] - ring_areas[k_1+1] + shoelace(ring[k_2], point_2) + shoelace(point_2, point_1)) / 2
+            if loop_area > largest_loop_area:
+                largest_loop, largest_loop_area = [point_1] + ring[k_1+1:k_2+1] + ([point_2] if k_2 < len(ring) - 1 else []), loop_area
+
+    # Traverse outline, cut off loops at crossing earlier segments, the ring continues from the crossing with the earliest segment
+    points = [tuple(point) for point in outline]
+    ring = [points[0]]
+    ring_areas = [0]
+    segment_ids = []
+    positions = {}
+    for j in range(num_points - 1):
+        crossings = ring_crossings(j, ring[-1], points[j+1])
+        if crossings:
+            keep_largest_loop(crossings + [(len(ring) - 1, ring[-1])])
+            k, intersection_point = crossings[0]
+            del ring[k+1:]
+            del ring_areas[k+1:]
+            del segment_ids[k+1:]
+            ring.append(intersection_point)
+            ring_areas.append(ring_areas[-1] + shoelace(ring[-2], ring[-1]))
+        positions[j] = len(segment_ids)
+        segment_ids.append(j)
+        ring.append(points[j+1])
+        ring_areas.append(ring_areas[-1] + shoelace(ring[-2], ring[-1]))
+
+    # Closing segment splits the ring into loops as well, without crossings the whole ring is one loop
+    keep_largest_loop(ring_crossings(num_points - 1, ring[-1], ring[0]) + [(0, ring[0]), (len(ring) - 1, ring[-1])])
+    ring = largest_loop
+
+    return ring + [ring[0]]
+
+def point_coordinates(points):
+    """
+    Returns point coordinates as contiguous (N, 2) float array without creating shapely objects for array input.
+
+    Parameters
+    ----------
+    points: np.ndarray | shapely.MultiPoint | list(tuple(float, float))
+            Points as (N, 2) array, MultiPoint or list of coordinates
+
+    Returns
+    ----------
+    np.ndarray
+            (N, 2) array of point coordinates
+    """
+    if isinstance(points, Geometry):
+        return get_coordinates(points)
+    return np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+
+def phoenix_hull_polygon(district_borders, buffer_size, listing_points, border_points):
+    """
+    Computes the buffered hull polygon a Phoenixmap is fitted to.
 
     Parameters
     ----------
     district_borders: bool
-            If True generate Phoenixmap from specified district borders, if False generate Phoenixmap from convex hull
+            If True use specified district borders, if False use convex hull of listing points
     buffer_size: float
             Size of buffer applied to convex hull/ district border
+    listing_points: np.ndarray | shapely.MultiPoint
+            (N, 2) spatial data points (here district listings coordinates), only used if district_borders is False
+    border_points: np.ndarray | shapely.MultiPoint
+            (N, 2) area border data points (here district border coordinates), only used if district_borders is True
+
+    Returns
+    ----------
+    shapely.Polygon
+            Buffered hull polygon
+    """
+    if district_borders:
+        # Compute hull polygon from border points
+        return Polygon(point_coordinates(border_points)).buffer(buffer_size)
+    # Compute a buffered hull polygon, the MultiPoint is created from the array in one call
+    return convex_hull(multipoints(point_coordinates(listing_points))).buffer(buffer_size)
+
+def adaptive_segment_params(bspline, param_range, num_segments, segment_tolerance=None, samples_per_segment=16):
+    """
+    Places segment breakpoints on a B-Spline by curvature: strongly curved parts get short segments, straight stretches long ones.
+    The chord error of a segment of length h is about curvature * h^2 / 8, so breakpoints are spread evenly over the arc length weighted
+    by sqrt(curvature). Half of the weight is plain arc length, so straight stretches keep some segments.
+
+    Parameters
+    ----------
+    bspline: tuple
+            B-Spline representation as returned by scipy.interpolate.splprep()
+    param_range: np.ndarray
+            Parameters of the fitted points as returned by scipy.interpolate.splprep()
+    num_segments: int
+            Maximum number of breakpoints (segment budget)
+    segment_tolerance: float
+            If set, only as many breakpoints as needed to keep the distance of the B-Spline to the polygon of segment midpoints below this tolerance are placed (at most num_segments)
+    samples_per_segment: int
+            Number of B-Spline samples per segment the curvature is evaluated at
+
+    Returns
+    ----------
+    np.ndarray
+            Increasing breakpoint parameters from param_range.min() to param_range.max()
+    """
+    sample_params = np.linspace(param_range.min(), param_range.max(), samples_per_segment * num_segments + 1)
+    tangent_vecs = np.column_stack(sci.splev(sample_params, bspline, der=1))
+    sec_derivs = np.column_stack(sci.splev(sample_params, bspline, der=2))
+    speeds = np.linalg.norm(tangent_vecs, axis=1)
+    curvatures = np.abs(tangent_vecs[:, 0] * sec_derivs[:, 1] - tangent_vecs[:, 1] * sec_derivs[:, 0]) / (speeds ** 3)
+
+    # Breakpoint density per arc length
+    demand = np.sqrt(curvatures)
+    densities = demand / max(np.average(demand, weights=speeds), 1e-12) + 1
+    weights = densities * speeds
+    cumulative_weights = np.concatenate(([0], np.cumsum((weights[1:] + weights[:-1]) / 2 * np.diff(sample_params))))
+
+    def breakpoints(count):
+        return np.interp(np.linspace(0, cumulative_weights[-1], count), cumulative_weights, sample_params)
+
+    if segment_tolerance is None:
+        return breakpoints(num_segments)
+
+    # Segment length at a sample is total weight / (count * density), solving curvature * h^2 / 8 <= tolerance gives a lower bound of the count.
+    # The estimate does not hold at sharp corners (curvature * h >> 1), so the smallest sufficient count is bisected on the measured error.
+    bspline_line = LineString(np.column_stack(sci.splev(sample_params, bspline, der=0)))
+    def midpoint_error(count):
+        params = breakpoints(count)
+        midpoints = np.column_stack(sci.splev((params[1:] + params[:-1]) / 2, bspline, der=0))
+        return hausdorff_distance(bspline_line, LineString(np.vstack((midpoints, midpoints[:1]))))
+
+    estimate = np.max(np.sqrt(curvatures / (8 * segment_tolerance)) * cumulative_weights[-1] / densities)
+    lower, upper = int(min(max(math.ceil(estimate) + 1, 4), num_segments)), num_segments
+    while lower < upper:
+        count = (lower + upper) // 2
+        if midpoint_error(count) <= segment_tolerance:
+            upper = count
+        else:
+            lower = count + 1
+    return breakpoints(lower)
+
+def fit_bspline_segments(hull_polygon, num_segments, segmentation="uniform", segment_tolerance=None):
+    """
+    Fits a closed B-Spline (degree 3) curve through a hull polygon and divides it into segments.
+
+    Parameters
+    ----------
+    hull_polygon: shapely.Polygon
+            Hull polygon (see phoenix_hull_polygon())
+    num_segments: int
+            Number of segments to divide fitted B-Spline curve for inscribed circle fitting (maximum number for adaptive segmentation)
+    segmentation: str
+            "uniform" divides the B-Spline evenly in parameter space, "adaptive" places breakpoints by curvature (see adaptive_segment_params())
+    segment_tolerance: float
+            Chord error tolerance of adaptive segmentation, if set fewer than num_segments segments may be used
+
+    Returns
+    ----------
+    dict
+            Segments with keys "bspline_polygon" (shapely.Polygon), "midpoints", "normals" (normalized, pointing inside B-Spline), "max_radii" (upper bound of inscribed circle radii),
+            "bspline" (B-Spline representation of scipy.interpolate.splprep()) and "mid_params" (B-Spline parameters of the midpoints)
+    """
+    # Fit a B-Spline (degree 3) curve through buffered convex hull
+    bspline, param_range = sci.splprep(np.array(hull_polygon.exterior.coords).T, u=None, s=0.0, per=1, k=3) 
+    
+    # Get discrete segments on B-Spline curve
+    if segmentation == "adaptive":
+        segment_params = adaptive_segment_params(bspline, param_range, num_segments, segment_tolerance)
+    else:
+        segment_params = np.linspace(param_range.min(), param_range.max(), num_segments)
+    bspline_xs, bspline_ys = sci.splev(segment_params, bspline, der=0)
+    # Get polygon from segments
+    bspline_polygon = Polygon(np.column_stack((bspline_xs, bspline_ys)))
+
+    # Compute tangents at segments midpoints
+    mid_params = ((segment_params + np.roll(segment_params, 1, axis=0))/2)[1:]
+    midpoints = np.column_stack(sci.splev(mid_params, bspline, der=0))
+    tangent_vecs = np.column_stack(sci.splev(mid_params, bspline, der=1))
+    tangent_norms = np.linalg.norm(tangent_vecs, axis=1)
+
+    # Compute curvature from segments midpoint tangents
+    sec_derivs = np.column_stack(sci.splev(mid_params, bspline, der=2))
+    cross_products = tangent_vecs[:, 0] * sec_derivs[:, 1] - tangent_vecs[:, 1] * sec_derivs[:, 0]
+    curvatures = np.abs(cross_products) / (tangent_norms ** 3)
+
+    # Compute normalized orthogonal vectors (pointing inside B-spline) from tangents 
+    norm_tangent_vecs = tangent_vecs / tangent_norms[:, np.newaxis]
+    rotation_angle = math.radians(-90)
+    norm_ortho_to_tangent_vecs = np.column_stack((math.cos(rotation_angle)*norm_tangent_vecs[:, 0] - math.sin(rotation_angle)*norm_tangent_vecs[:, 1], math.sin(rotation_angle)*norm_tangent_vecs[:, 0] + math.cos(rotation_angle)*norm_tangent_vecs[:, 1]))
+    
+    # Compute upper bound for circle radius
+    max_circle_radius = np.sqrt(hull_polygon.area / math.pi)
+    with np.errstate(divide="ignore"):
+        max_curvature_radii = curvatures ** -1
+    clamped_max_radius = np.maximum(np.minimum(max_curvature_radii, max_circle_radius), 0)
+
+    return {"bspline_polygon": bspline_polygon, "midpoints": midpoints, "normals": norm_ortho_to_tangent_vecs, "max_radii": clamped_max_radius, "bspline": bspline, "mid_params": mid_params}
+
+def fit_segment_circles(segments, circle_step_shrink_factor, circle_tolerance=None, profiler=None):
+    """
+    Fits inscribed circles at the segment midpoints.
+
+    Parameters
+    ----------
+    segments: dict
+            Segments as returned by fit_bspline_segments()
+    circle_step_shrink_factor: float
+            Shrinking of inscribed circle per iteration in inscribed circle fitting (only used if circle_tolerance is None)
+    circle_tolerance: float
+            If set, inscribed circle radii are computed by bisection up to this tolerance instead of iterative shrinking
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()), records circle fitting iterations
+
+    Returns
+    ----------
+    tuple(np.ndarray, np.ndarray)
+            Circle radii and (N, 2) circle centers
+    """
+    bspline_polygon = segments["bspline_polygon"]
+    if circle_tolerance is not None:
+        # Bisect radius up to tolerance
+        return fit_inscribed_circles(bspline_polygon, segments["midpoints"], segments["normals"], segments["max_radii"], circle_tolerance, profiler=profiler)
+    # Shrink radius until circles fit
+    return shrink_inscribed_circles(bspline_polygon, segments["midpoints"], segments["normals"], segments["max_radii"], circle_step_shrink_factor, profiler=profiler)
+
+def build_segment_structure(hull_polygon, num_segments, circle_step_shrink_factor, circle_tolerance=None, profiler=None, segmentation="uniform", segment_tolerance=None):
+    """
+    Builds the listing independent part of a Phoenixmap: B-Spline segments, inscribed circles and the rectangles densities are measured in.
+    The structure only depends on the hull, so it can be shared by all Phoenixmaps of one district border.
+
+    Parameters
+    ----------
+    hull_polygon: shapely.Polygon
+            Hull polygon (see phoenix_hull_polygon())
     num_segments: int
             Number of segments to divide fitted B-Spline curve for inscribed circle fitting 
-    averaging_range: bool
+    circle_step_shrink_factor: float
+            Shrinking of inscribed circle per iteration in inscribed circle fitting (only used if circle_tolerance is None)
+    circle_tolerance: float
+            If set, inscribed circle radii are computed by bisection up to this tolerance instead of iterative shrinking
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()), records stages spline_fit, circle_fit and rectangles
+    segmentation: str
+            "uniform" or "adaptive" placement of segment breakpoints (see fit_bspline_segments())
+    segment_tolerance: float
+            Chord error tolerance of adaptive segmentation (see adaptive_segment_params())
+
+    Returns
+    ----------
+    dict
+            Segments (see fit_bspline_segments()) with additional keys "circle_radii", "circle_centers", "rectangles" (shapely.Polygon array) and "rectangle_areas"
+    """
+    with profile_stage(profiler, "spline_fit", num_segments=num_segments, segmentation=segmentation):
+        structure = fit_bspline_segments(hull_polygon, num_segments, segmentation, segment_tolerance)
+    record_count(profiler, "segments", len(structure["midpoints"]) + 1)
+    with profile_stage(profiler, "circle_fit", bisection=circle_tolerance is not None):
+        circle_radii, circle_centers = fit_segment_circles(structure, circle_step_shrink_factor, circle_tolerance, profiler)
+    with profile_stage(profiler, "rectangles"):
+        rectangles = build_segment_rectangles(structure["midpoints"], circle_centers)
+
+    structure.update({"circle_radii": circle_radii, "circle_centers": circle_centers, "rectangles": rectangles, "rectangle_areas": area(rectangles)})
+    return structure
+
+def build_segment_rectangles(midpoints, circle_centers):
+    """
+    Constructs the rectangles between consecutive segment midpoints and their inscribed circle centers.
+
+    Parameters
+    ----------
+    midpoints: np.ndarray
+            (N, 2) segment midpoints
+    circle_centers: np.ndarray
+            (N, 2) inscribed circle centers
+
+    Returns
+    ----------
+    np.ndarray(shapely.Polygon)
+            N - 1 rectangles
+    """
+    return polygons(np.stack((midpoints[:-1], circle_centers[:-1], circle_centers[1:], midpoints[1:], midpoints[:-1]), axis=1))
+
+def compute_segment_densities(structure, listing_index, listing_selection=None):
+    """
+    Computes the listing density of every rectangle of a segment structure.
+
+    Parameters
+    ----------
+    structure: dict
+            Segment structure as returned by build_segment_structure()
+    listing_index: shapely.STRtree
+            Spatial index over listing points (see build_listing_index())
+    listing_selection: np.ndarray(bool) | slice
+            Optional mask or range over the indexed points, only selected points are counted
+
+    Returns
+    ----------
+    np.ndarray
+            Number of listings per rectangle area
+    """
+    return count_points_in_polygons(structure["rectangles"], listing_index, listing_selection) / structure["rectangle_areas"]
+
+def build_projection_table(structure, samples_per_segment=16):
+    """
+    Samples the B-Spline of a segment structure densely for projecting listings onto it (see compute_projection_densities()).
+    Every sample carries the rectangle whose parameter range it falls into, the depth of the counted band (inscribed circle radius interpolated
+    between the segment ends) and the area of its part of the band: arc length of the sample times depth, corrected for the B-Spline curvature.
+
+    Parameters
+    ----------
+    structure: dict
+            Segment structure as returned by build_segment_structure()
+    samples_per_segment: int
+            Number of B-Spline samples per segment, bounds the parameter error of the projection
+
+    Returns
+    ----------
+    dict
+            Sample "params", "normals" (normalized, pointing inside B-Spline), "rectangle_ids" (-1 outside all rectangles), band "depths",
+            KD-tree "tree" over the sample points, maximum distance of neighbouring samples "spacing" and band area per rectangle "band_areas"
+    """
+    bspline = structure["bspline"]
+    # Closed B-Spline, parameter range of splprep() is [0, 1]
+    sample_params = np.linspace(0, 1, samples_per_segment * (len(structure["midpoints"]) + 1), endpoint=False)
+    sample_points = np.column_stack(sci.splev(sample_params, bspline, der=0))
+    tangent_vecs = np.column_stack(sci.splev(sample_params, bspline, der=1))
+    tangent_norms = np.linalg.norm(tangent_vecs, axis=1)
+    # Rotation by -90 degrees like the segment normals of fit_bspline_segments()
+    sample_normals = np.column_stack((tangent_vecs[:, 1], -tangent_vecs[:, 0])) / tangent_norms[:, np.newaxis]
+    sample_distances = np.linalg.norm(sample_points - np.roll(sample_points, 1, axis=0), axis=1)
+
+    # Rectangle k spans the parameters between midpoints k and k + 1
+    mid_params = structure["mid_params"]
+    num_rectangles = len(mid_params) - 1
+    rectangle_ids = np.searchsorted(mid_params, sample_params, side="right") - 1
+    rectangle_ids[(rectangle_ids < 0) | (rectangle_ids >= num_rectangles)] = -1
+    valid = rectangle_ids >= 0
+    position = np.zeros(len(sample_params))
+    position[valid] = (sample_params[valid] - mid_params[rectangle_ids[valid]]) / (mid_params[rectangle_ids[valid] + 1] - mid_params[rectangle_ids[valid]])
+    depths = np.zeros(len(sample_params))
+    depths[valid] = (1 - position[valid]) * structure["circle_radii"][rectangle_ids[valid]] + position[valid] * structure["circle_radii"][rectangle_ids[valid] + 1]
+
+    # Band of depth d along an arc of length s with curvature k (positive if bending inside) has area s * d * (1 - k * d / 2)
+    sec_derivs = np.column_stack(sci.splev(sample_params, bspline, der=2))
+    curvatures = np.einsum("ij,ij->i", sec_derivs, sample_normals) / tangent_norms ** 2
+    arc_lengths = (sample_distances + np.roll(sample_distances, -1)) / 2
+    sample_areas = arc_lengths * depths * np.maximum(1 - curvatures * depths / 2, 0)
+    band_areas = np.bincount(rectangle_ids[valid], weights=sample_areas[valid], minlength=num_rectangles)
+
+    return {"params": sample_params, "normals": sample_normals, "rectangle_ids": rectangle_ids, "depths": depths, "tree": cKDTree(sample_points),
+            "spacing": sample_distances.max(), "band_areas": band_areas}
+
+def compute_projection_densities(structure, listing_coords):
+    """
+    Computes the listing density of every rectangle of a segment structure by projecting listings onto the B-Spline instead of testing rectangles.
+    A listing counts for the segment its nearest B-Spline parameter falls into if it lies inside the B-Spline within the inscribed circle radius
+    (interpolated between the segment ends). All listings are projected in one KD-tree query, O(N log S) for N listings and S B-Spline samples.
+    Counts are divided by the area of the counted band (see build_projection_table()), which follows the B-Spline instead of the chord between midpoints,
+    so densities approximate compute_segment_densities().
+
+    Parameters
+    ----------
+    structure: dict
+            Segment structure as returned by build_segment_structure(), the projection table (see build_projection_table()) is added on first use
+    listing_coords: np.ndarray
+            (N, 2) array of listing coordinates
+
+    Returns
+    ----------
+    np.ndarray
+            Number of listings per band area of each rectangle
+    """
+    if "projection_table" not in structure:
+        structure["projection_table"] = build_projection_table(structure)
+    table = structure["projection_table"]
+
+    # Listings farther from the B-Spline than the largest circle radius are not counted, bounding the search prunes the KD-tree query
+    listing_coords = np.asarray(listing_coords, dtype=np.float64).reshape(-1, 2)
+    distances, sample_ids = table["tree"].query(listing_coords, distance_upper_bound=structure["circle_radii"].max() + table["spacing"])
+    found = sample_ids < len(table["params"])
+    listing_coords, distances, sample_ids = listing_coords[found], distances[found], sample_ids[found]
+    inside = np.einsum("ij,ij->i", listing_coords - table["tree"].data[sample_ids], table["normals"][sample_ids]) >= 0
+
+    rectangle_ids = table["rectangle_ids"][sample_ids]
+    counted = rectangle_ids[inside & (rectangle_ids >= 0) & (distances <= table["depths"][sample_ids])]
+    counts = np.bincount(counted, minlength=len(table["band_areas"]))
+    # Segments shorter than the sample spacing get no samples, hence no band and no listings
+    return np.divide(counts, table["band_areas"], out=np.zeros(len(counts)), where=table["band_areas"] > 0)
+
+def _circular_window_sums(values, averaging_range, kernel):
+    # Window of circle position c covers rectangles c-averaging_range .. c+averaging_range-1 (wrapping around the closed chain)
+    n = len(values)
+    centers = np.arange(n)
+    if kernel == "box":
+        # Prefix sums over the chain repeated infinitely: sum(values[0:k]) = (k // n) * total + prefix[k % n]
+        prefix = np.concatenate(([0.0], np.cumsum(values)))
+        def cyclic_prefix(k):
+            return (k // n) * prefix[-1] + prefix[k % n]
+        return cyclic_prefix(centers + averaging_range) - cyclic_prefix(centers - averaging_range)
+
+    # Fold kernel weights onto the chain, circular correlation via FFT
+    offsets = np.arange(-averaging_range, averaging_range)
+    folded_kernel = np.zeros(n)
+    np.add.at(folded_kernel, offsets % n, AVERAGING_KERNELS[kernel](offsets + 0.5, averaging_range))
+    return np.fft.irfft(np.conj(np.fft.rfft(folded_kernel)) * np.fft.rfft(values), n)
+
+def average_segment_densities(rectangle_densities, rectangle_areas, averaging_range, averaging_kernel="box"):
+    """
+    Computes the area weighted moving average of rectangle densities along the closed segment chain.
+    Window sums are computed with prefix sums (box kernel) or FFT (other kernels), cost does not depend on averaging_range.
+
+    Parameters
+    ----------
+    rectangle_densities: np.ndarray
+            Density per rectangle (see compute_segment_densities())
+    rectangle_areas: np.ndarray
+            Area per rectangle
+    averaging_range: int
             Number of segments to average over in weighted arithmetic mean calculation
-    density_scale: bool
+    averaging_kernel: str
+            Weighting of segments within the averaging range, see AVERAGING_KERNELS ("box" weights all segments equally)
+
+    Returns
+    ----------
+    np.ndarray
+            Averaged density per circle (one more than rectangles)
+    """
+    weights = rectangle_areas + 10e-15 # Division by zero escape
+    wam_densities = _circular_window_sums(weights * rectangle_densities, averaging_range, averaging_kernel) / _circular_window_sums(weights, averaging_range, averaging_kernel)
+
+    # Circle i averages the window around rectangle i+1, the last circle closes the chain
+    return wam_densities[(np.arange(len(rectangle_areas) + 1) + 1) % len(rectangle_areas)]
+
+def build_phoenix_outline(structure, wam_segment_densities, density_scale, profiler=None):
+    """
+    Builds the Phoenixmap polygon from the segment midpoints (outer outline) and the midpoints moved inside by the averaged densities (inner outline).
+
+    Parameters
+    ----------
+    structure: dict
+            Segment structure as returned by build_segment_structure()
+    wam_segment_densities: np.ndarray
+            Averaged density per circle (see average_segment_densities())
+    density_scale: float
             Scale to map calculated density to line-thickness, dependend on size of overserved space
-    circle_step_shrink_factor: float
-            Shrinking of inscribed circle per iteration in inscribed circle fitting  
-    listing_points: list(tuple(float, float))
-            List of spatial data points (here district listings coordinates)
-    border_points: list(tuple(float, float))
-            List of area border data points (here district border coordinates)
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()), records removed loop vertices and make_valid fallbacks
 
     Returns
     ----------
     list(list(tuple(float, float)))
             Polygon of generated Phoenixmap
     """
-    if not listing_points.is_empty:
-        if district_borders:
-            # Compute hull polygon from border points
-            buffered_hull_polygon = Polygon(border_points.geoms).buffer(buffer_size)
-        else:
-            # Compute a buffered hull polygon
-            buffered_hull_polygon = listing_points.convex_hull.buffer(buffer_size)
+    midpoints = structure["midpoints"]
 
-        # Fit a B-Spline (degree 3) curve through buffered convex hull
-        bspline, param_range = sci.splprep(np.array(buffered_hull_polygon.exterior.coords).T, u=None, s=0.0, per=1, k=3) 
-        
-        # Get discrete segments on B-Spline curve
-        segment_params = np.linspace(param_range.min(), param_range.max(), num_segments)
-        bspline_xs, bspline_ys = sci.splev(segment_params, bspline, der=0)
-        segments = list(zip(bspline_xs, bspline_ys))
-        # Get polygon from segments
-        bspline_polygon = Polygon(zip(bspline_xs, bspline_ys))
-
-        # Compute tangents at segments midpoints
-        mid_params = ((segment_params + np.roll(segment_params.copy(), 1, axis=0))/2)[1:]
-        midpoint_xs, midpoint_ys = sci.splev(mid_params, bspline, der=0)
-        midpoints = list(zip(midpoint_xs, midpoint_ys))
-        tangent_xs, tangent_ys = sci.splev(mid_params, bspline, der=1)
-        tangent_vecs = list(zip(tangent_xs, tangent_ys))
-
-        # Compute curvature from segments midpoint tangents
-        sec_deriv_xs, sec_deriv_ys = sci.splev(mid_params, bspline, der=2)
-        sec_derivs = list(zip(sec_deriv_xs, sec_deriv_ys))
-        curvatures = []
-        for t, sd in zip(tangent_vecs, sec_derivs):
-            cross_product = np.cross(t, sd)
-            curvature = np.linalg.norm(cross_product) / (np.linalg.norm(t) ** 3)
-            curvatures.append(curvature)
-
-        # Compute normalized orthogonal vectors (pointing inside B-spline) from tangents 
-        norm_tangent_vecs = [v/np.linalg.norm(v) for v in tangent_vecs]
-        rotation_angle = math.radians(-90)
-        norm_ortho_to_tangent_vecs = [(math.cos(rotation_angle)*v[0] - math.sin(rotation_angle)*v[1], math.sin(rotation_angle)*v[0] + math.cos(rotation_angle)*v[1]) for v in norm_tangent_vecs]
-        
-        # Compute upper bound for circle radius
-        max_circle_radius = np.sqrt(buffered_hull_polygon.area / math.pi)
-        max_curvature_radii = [c**-1 for c in curvatures]
-        clamped_max_radius = [max(min(radius, max_circle_radius), 0) for radius in max_curvature_radii]
-
-        # Compute inscribed circles
-        circle_radii = []
-        circle_centers = []
-        for i, (midpoint, norm_ortho_to_tangent_vec, max_radius) in enumerate(zip(midpoints, norm_ortho_to_tangent_vecs, clamped_max_radius)):
-            while True:
-                circle_bound = (midpoint[0] + (norm_ortho_to_tangent_vec[0] * max_radius * 2), midpoint[1] + (norm_ortho_to_tangent_vec[1] * max_radius * 2))
-                circle = minimum_bounding_circle(MultiPoint([midpoint, circle_bound]))
-
-                # Check if circle fits inside B-Spline curve
-                if circle.within(bspline_polygon) or max_radius < 0.0000005:
-                    circle_center = (midpoint[0] + (norm_ortho_to_tangent_vec[0] * max_radius), midpoint[1] + (norm_ortho_to_tangent_vec[1] * max_radius))                  
-                    circle_centers.append(circle_center)                          
-                    circle_radii.append(max_radius)
-                    break
-                # Decrease radius until it fits inside B-spline polygon
-                else:
-                    max_radius = max_radius * circle_step_shrink_factor
-
-        # Compute rectangular densities
-        rectangle_densities = []
-        rectangle_areas = []
-        for i in range(len(midpoints) - 1):
-            # Construct rectangle areas from circle centers and midpoints
-            rectangle = Polygon([midpoints[i], circle_centers[i], circle_centers[i+1], midpoints[i+1], midpoints[i]])
-            rectangle_area = rectangle.area
-            rectangle_points = [point for point in list(listing_points.geoms) if within(point, rectangle)]
-            rectangle_density = len(rectangle_points) / rectangle_area                   
-            rectangle_densities.append(rectangle_density)
-            rectangle_areas.append(rectangle_area)
-
-        # Compute weighted moving average densities for segments
-        wam_segment_densities = []
-        rectangle_densities = np.concatenate((np.concatenate((rectangle_densities, rectangle_densities)), rectangle_densities))
-        rectangle_areas = np.concatenate((np.concatenate((rectangle_areas, rectangle_areas)), rectangle_areas))
-        number_of_circles = len(circle_centers)
-        for i in range(number_of_circles, 2*number_of_circles):  # Start idx in "middle" run until "end of middle" 
-            lower_range_limit = i - averaging_range
-            upper_range_limit = i + averaging_range
-            densities_for_average = rectangle_densities[lower_range_limit:upper_range_limit]
-            weights_for_average = rectangle_areas[lower_range_limit:upper_range_limit]
-            weights_for_average = weights_for_average + 10e-15 # Division by zero escape
-
-            wam_segment_densities.append(np.average(densities_for_average, weights=weights_for_average))
-
-        # Build outer polygon
-        outline_polygon_outer = []
-        border_polygon = []
-        for i in range(len(midpoints)-1):
-            segment_startpoint = midpoints[i]
-            outline_polygon_outer.append(segment_startpoint)
-            border_polygon.append(segment_startpoint)
-        outline_polygon_outer.append(outline_polygon_outer[0])
-    
-        # Build inner polygon
-        outline_polygon_inner_primary = []
-        midpoints.reverse()
-        wam_segment_densities.reverse()
-        norm_ortho_to_tangent_vecs.reverse()
-
-        segment_density = wam_segment_densities[0] * density_scale
-        x = norm_ortho_to_tangent_vecs[0][0] * segment_density
-        y = norm_ortho_to_tangent_vecs[0][1] * segment_density
-        corner_point = (midpoints[0][0] + x, midpoints[0][1] + y)
-        outline_polygon_inner_primary.append(corner_point)
-
-        # Escape loops in inner polygon
-        for i in range(len(midpoints)-1):
-            segment_density = wam_segment_densities[i] * density_scale
-            x = norm_ortho_to_tangent_vecs[i][0] * segment_density
-            y = norm_ortho_to_tangent_vecs[i][1] * segment_density
-            corner_point = (midpoints[i][0] + x, midpoints[i][1] + y)
-
-            past_segment_lines = []
-            line = LineString([outline_polygon_inner_primary[-1], corner_point])
-            if len(past_segment_lines) >= 2:
-                intersecting = False
-                for line_to_check in past_segment_lines[:-1]:
-                    if(line.intersects(line_to_check)):
-                        intersecting = True
-                        index = past_segment_lines.index(line_to_check)
-                        intersection_point = line.intersection(line_to_check).coords[0]
-
-                        outline_polygon_inner_primary = outline_polygon_inner_primary[:index+1]
-                        past_segment_lines = past_segment_lines[:index]
-                        
-                        past_segment_lines.append(LineString([outline_polygon_inner_primary[-1], intersection_point]))
-                        past_segment_lines.append(LineString([intersection_point, corner_point]))
-                        outline_polygon_inner_primary.append(intersection_point)
-                        outline_polygon_inner_primary.append(corner_point)
-                        break
-                if not intersecting:
-                    past_segment_lines.append(line)
-                    outline_polygon_inner_primary.append(corner_point)
-            else:
-                past_segment_lines.append(line)
-                outline_polygon_inner_primary.append(corner_point)
-            
-        outline_polygon_inner_primary.append(outline_polygon_inner_primary[0])
-
-        # Escape start/end loops in inner polygon to avoid artifacts
-        inner_multi_polygons = make_valid(Polygon(outline_polygon_inner_primary))
-        outline_polygon_inner = None
+    # Build outer polygon
+    outline_polygon_outer = np.vstack((midpoints[:-1], midpoints[:1]))
+
+    # Build inner polygon
+    midpoints = midpoints[::-1]
+    wam_segment_densities = wam_segment_densities[::-1]
+    norm_ortho_to_tangent_vecs = structure["normals"][::-1]
+    corner_points = midpoints + norm_ortho_to_tangent_vecs * (wam_segment_densities * density_scale)[:, np.newaxis]
+
+    # Escape loops in inner polygon
+    outline_polygon_inner = remove_outline_loops(corner_points[:-1])
+    record_count(profiler, "outline_removed_vertices", len(corner_points) - len(outline_polygon_inner))
+
+    # Escape remaining degenerate loops (e.g. overlapping collinear segments)
+    if not is_valid(Polygon(outline_polygon_inner)):
+        record_count(profiler, "outline_make_valid", 1)
+        inner_multi_polygons = make_valid(Polygon(outline_polygon_inner))
         max_polygon_area = 0
         if type(inner_multi_polygons) == MultiPolygon:
             for polygon in inner_multi_polygons.geoms:
@@ -199,119 +741,412 @@ def generate_phoenix_map(district_borders, buffer_size, num_segments, averaging_
                     outline_polygon_inner = list(polygon.exterior.coords)
         else:
             outline_polygon_inner = list(inner_multi_polygons.exterior.coords)
-        
-                
-        outline_polygon = outline_polygon_outer + outline_polygon_inner
-
-        # Close polygon to avoid artifacts
-        outline_polygon.append(outline_polygon_outer[-1])
-
-        # Create final polygon
-        shapely_polygon = Polygon(outline_polygon)
-        outline_polygon= list(shapely_polygon.exterior.coords)
-
-        # Debug plotting
-        """ pltpolygon = pltp.Polygon(outline_polygon)
-        fig, ax = plt.subplots()
-        ax = plt.subplot()
-        ax.set_aspect('equal', adjustable='box')
-        ax.add_patch(pltpolygon)
-        #ax.plot(bspline_xs, bspline_ys)
-        ax.scatter([p.x for p in listing_points.geoms], [p.y for p in listing_points.geoms], s=1)
-        plt.show() """
-        
-        return outline_polygon
-
-def setup_and_generate():
-    """
-    Flush polygon directories before generation. Load district border and district listing data. 
-    Start Phoenixmap generation tasks and save resulting polygons as json.
+
+    # Close polygon to avoid artifacts
+    outline_polygon = np.vstack((outline_polygon_outer, outline_polygon_inner, outline_polygon_outer[-1:]))
+
+    # Create final polygon
+    shapely_polygon = Polygon(outline_polygon)
+    return list(shapely_polygon.exterior.coords)
+
+def phoenix_map_from_structure(structure, averaging_range, density_scale, listing_points, listing_index=None, listing_selection=None, profiler=None, averaging_kernel="box", density_mode="rectangles"):
+    """
+    Generates a Phoenixmap for listings from a precomputed segment structure.
+
+    Parameters
+    ----------
+    structure: dict
+            Segment structure as returned by build_segment_structure()
+    averaging_range: int
+            Number of segments to average over in weighted arithmetic mean calculation
+    density_scale: float
+            Scale to map calculated density to line-thickness, dependend on size of overserved space
+    listing_points: np.ndarray | shapely.MultiPoint
+            (N, 2) spatial data points (here district listings coordinates)
+    listing_index: shapely.STRtree
+            Optional spatial index over listing points (see build_listing_index()), built from listing_points if None
+    listing_selection: np.ndarray(bool) | slice
+            Optional mask or range over the indexed points selecting listing_points, required if listing_index covers more points than listing_points
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()), records stages listing_index, density_count, wam and outline
+    averaging_kernel: str
+            Weighting of segments within the averaging range (see AVERAGING_KERNELS)
+    density_mode: str
+            "rectangles" counts listings in the segment rectangles (see compute_segment_densities()),
+            "projection" projects listings onto the B-Spline (see compute_projection_densities()), listing_index is not used
+
+    Returns
+    ----------
+    list(list(tuple(float, float)))
+            Polygon of generated Phoenixmap
+    """
+    listing_coords = point_coordinates(listing_points)
+    num_listings = len(listing_coords)
+    if density_mode == "projection":
+        with profile_stage(profiler, "density_projection", num_listings=num_listings, num_rectangles=len(structure["rectangles"])):
+            rectangle_densities = compute_projection_densities(structure, listing_coords)
+    else:
+        if listing_index is None:
+            with profile_stage(profiler, "listing_index", num_listings=num_listings):
+                listing_index = build_listing_index(listing_coords)
+        with profile_stage(profiler, "density_count", num_listings=num_listings, num_rectangles=len(structure["rectangles"])):
+            rectangle_densities = compute_segment_densities(structure, listing_index, listing_selection)
+    with profile_stage(profiler, "wam"):
+        wam_segment_densities = average_segment_densities(rectangle_densities, structure["rectangle_areas"], averaging_range, averaging_kernel)
+    with profile_stage(profiler, "outline"):
+        outline_polygon = build_phoenix_outline(structure, wam_segment_densities, density_scale, profiler)
+
+    # Debug plotting
+    """ pltpolygon = pltp.Polygon(outline_polygon)
+    fig, ax = plt.subplots()
+    ax = plt.subplot()
+    ax.set_aspect('equal', adjustable='box')
+    ax.add_patch(pltpolygon)
+    #ax.plot(bspline_xs, bspline_ys)
+    ax.scatter(listing_coords[:, 0], listing_coords[:, 1], s=1)
+    plt.show() """
+    
+    return outline_polygon
+
+def generate_phoenix_map(district_borders, buffer_size, num_segments, averaging_range, density_scale, circle_step_shrink_factor, listing_points, border_points, listing_index=None, listing_selection=None, circle_tolerance=None, profiler=None, averaging_kernel="box", density_mode="rectangles", segmentation="uniform", segment_tolerance=None):
+    """
+    Generates Phoenixmap with specified parameters from specified listings.
+
+    Parameters
+    ----------
+    district_borders: bool
+            If True generate Phoenixmap from specified district borders, if False generate Phoenixmap from convex hull
+    buffer_size: float
+            Size of buffer applied to convex hull/ district border
+    num_segments: int
+            Number of segments to divide fitted B-Spline curve for inscribed circle fitting 
+    averaging_range: bool
+            Number of segments to average over in weighted arithmetic mean calculation
+    density_scale: bool
+            Scale to map calculated density to line-thickness, dependend on size of overserved space
+    circle_step_shrink_factor: float
+            Shrinking of inscribed circle per iteration in inscribed circle fitting (only used if circle_tolerance is None)
+    listing_points: np.ndarray | shapely.MultiPoint
+            (N, 2) spatial data points (here district listings coordinates), arrays are used without creating shapely points
+    border_points: np.ndarray | shapely.MultiPoint
+            (N, 2) area border data points (here district border coordinates)
+    listing_index: shapely.STRtree
+            Optional spatial index over listing points (see build_listing_index()), built from listing_points if None
+    listing_selection: np.ndarray(bool) | slice
+            Optional mask or range over the indexed points selecting listing_points, required if listing_index covers more points than listing_points
+    circle_tolerance: float
+            If set, inscribed circle radii are computed by bisection up to this tolerance instead of iterative shrinking
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()) collecting per stage timings and counters, None disables profiling
+    averaging_kernel: str
+            Weighting of segments within the averaging range (see AVERAGING_KERNELS)
+    density_mode: str
+            "rectangles" counts listings in the segment rectangles (see compute_segment_densities()),
+            "projection" projects listings onto the B-Spline (see compute_projection_densities()), listing_index is not used
+    segmentation: str
+            "uniform" or "adaptive" placement of segment breakpoints (see fit_bspline_segments())
+    segment_tolerance: float
+            Chord error tolerance of adaptive segmentation (see adaptive_segment_params())
+
+    Returns
+    ----------
+    list(list(tuple(float, float)))
+            Polygon of generated Phoenixmap
+    """
+    return generate_phoenix_maps(district_borders, buffer_size, num_segments, averaging_range, density_scale, circle_step_shrink_factor, [listing_points], border_points, listing_index, [listing_selection], circle_tolerance, profiler, averaging_kernel, density_mode, segmentation, segment_tolerance)[0]
+
+def generate_phoenix_maps(district_borders, buffer_size, num_segments, averaging_range, density_scale, circle_step_shrink_factor, listing_point_sets, border_points, listing_index=None, listing_selections=None, circle_tolerance=None, profiler=None, averaging_kernel="box", density_mode="rectangles", segmentation="uniform", segment_tolerance=None):
+    """
+    Generates Phoenixmaps with specified parameters for many sets of listings (e.g. year ranges of one district).
+    From district borders the segment structure (B-Spline, inscribed circles, rectangles) is built once and shared by all sets,
+    from convex hulls it depends on the listings and is built per set.
+
+    Parameters
+    ----------
+    district_borders: bool
+            If True generate Phoenixmaps from specified district borders, if False generate Phoenixmaps from convex hulls
+    buffer_size: float
+            Size of buffer applied to convex hull/ district border
+    num_segments: int
+            Number of segments to divide fitted B-Spline curve for inscribed circle fitting 
+    averaging_range: int
+            Number of segments to average over in weighted arithmetic mean calculation
+    density_scale: float
+            Scale to map calculated density to line-thickness, dependend on size of overserved space
+    circle_step_shrink_factor: float
+            Shrinking of inscribed circle per iteration in inscribed circle fitting (only used if circle_tolerance is None)
+    listing_point_sets: list(np.ndarray | shapely.MultiPoint)
+            Sets of (N, 2) spatial data points (here district listings coordinates), one Phoenixmap is generated per set
+    border_points: np.ndarray | shapely.MultiPoint
+            (N, 2) area border data points (here district border coordinates)
+    listing_index: shapely.STRtree
+            Optional spatial index over the points of all sets (see build_listing_index()), built per set if None
+    listing_selections: list(np.ndarray(bool) | slice)
+            Mask or range over the indexed points per set, required if listing_index is set and covers more points than a set
+    circle_tolerance: float
+            If set, inscribed circle radii are computed by bisection up to this tolerance instead of iterative shrinking
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()) collecting per stage timings and counters, None disables profiling
+    averaging_kernel: str
+            Weighting of segments within the averaging range (see AVERAGING_KERNELS)
+    density_mode: str
+            "rectangles" counts listings in the segment rectangles (see compute_segment_densities()),
+            "projection" projects listings onto the B-Spline (see compute_projection_densities()), listing_index is not used
+    segmentation: str
+            "uniform" or "adaptive" placement of segment breakpoints (see fit_bspline_segments())
+    segment_tolerance: float
+            Chord error tolerance of adaptive segmentation (see adaptive_segment_params())
+
+    Returns
+    ----------
+    list(list(list(tuple(float, float))) | None)
+            Polygon of generated Phoenixmap per set, None for sets without listings
+    """
+    if listing_selections is None:
+        listing_selections = [None] * len(listing_point_sets)
+
+    structure = None
+    results = []
+    for listing_points, listing_selection in zip(listing_point_sets, listing_selections):
+        listing_points = point_coordinates(listing_points)
+        if len(listing_points) == 0:
+            results.append(None)
+            continue
+        if structure is None or not district_borders:
+            with profile_stage(profiler, "hull"):
+                hull_polygon = phoenix_hull_polygon(district_borders, buffer_size, listing_points, border_points)
+            structure = build_segment_structure(hull_polygon, num_segments, circle_step_shrink_factor, circle_tolerance, profiler, segmentation, segment_tolerance)
+        results.append(phoenix_map_from_structure(structure, averaging_range, density_scale, listing_points, listing_index, listing_selection, profiler, averaging_kernel, density_mode))
+    return results
+
+def generate_district_polygons(listings, borders, district, year_ranges, parameters, profiler=None):
+    """
+    Generates Phoenixmaps (from district border) of a district for every year range.
+    The spatial index over the district listings and the segment structure of the district border are built once and shared by all year ranges.
+
+    Parameters
+    ----------
+    listings: dict
+            Listings table (see listings_table.load_listings_table())
+    borders: dict(str, np.ndarray)
+            District border coordinates (see listings_table.load_district_borders())
+    district: str
+            Name of the district
+    year_ranges: list(tuple(int, int))
+            Year ranges (from_year, to_year) to generate Phoenixmaps for
+    parameters: dict
+            Generation parameters scale, num_segments, wam_range, circle_shrink, circle_tolerance, wam_kernel, density_mode, segmentation, segment_tolerance
+    profiler: dict
+            Optional profiler (see profiling.create_profiler())
+
+    Returns
+    ----------
+    list(tuple(str, list(list(tuple(float, float)))))
+            Output file (relative to app/ressources/) and polygon per year range
+    """
+    latitudes, longitudes, _ = district_listings(listings, district)
+    with profile_stage(profiler, "listing_index", district=district, num_listings=len(latitudes)):
+        listing_index = build_listing_index(np.column_stack((latitudes, longitudes)))
+    border_points = borders[district]
+
+    year_range_point_sets = []
+    year_range_selections = []
+    for from_year, to_year in year_ranges:
+        start, end = year_range_rows(listings, district, from_year, to_year)
+        year_range_point_sets.append(np.column_stack((latitudes[start:end], longitudes[start:end])))
+        year_range_selections.append(slice(start, end))
+
+    # All year ranges share the segment structure of the district border
+    district_borders = True
+    buffer = 0
+    with profile_stage(profiler, "district_polygons", district=district, num_year_ranges=len(year_ranges)):
+        district_polygons = generate_phoenix_maps(district_borders, buffer, parameters["num_segments"], parameters["wam_range"], parameters["scale"], parameters["circle_shrink"], year_range_point_sets, border_points, listing_index, year_range_selections, parameters["circle_tolerance"], profiler, parameters["wam_kernel"], parameters["density_mode"], parameters["segmentation"], parameters["segment_tolerance"])
+    return [("polygons_{}_{}/{}.json".format(from_year, to_year, district), polygon) for (from_year, to_year), polygon in zip(year_ranges, district_polygons)]
+
+def generate_bourse_year_polygons(listings, borders, variants, parameters, profiler=None):
+    """
+    Generates Phoenixmaps of district "Bourse" for single years. All variants share one spatial index of the Bourse listings.
+
+    Parameters
+    ----------
+    listings: dict
+            Listings table (see listings_table.load_listings_table())
+    borders: dict(str, np.ndarray)
+            District border coordinates (see listings_table.load_district_borders())
+    variants: list(tuple(list(int), bool, float))
+            Years to generate Phoenixmaps for, district_borders flag (if True generate Phoenixmap from district border, 
+            if False generate Phoenixmap from convex hull) and size of buffer applied to convex hull/ district border
+    parameters: dict
+            Generation parameters scale, num_segments, wam_range, circle_shrink, circle_tolerance, wam_kernel, density_mode, segmentation, segment_tolerance
+    profiler: dict
+            Optional profiler (see profiling.create_profiler())
+
+    Returns
+    ----------
+    list(tuple(str, list(list(tuple(float, float)))))
+            Output file (relative to app/ressources/) and polygon per variant and year
+    """
+    border_points = borders["Bourse"]
+    results = []
+    if(len(border_points) > 3):
+        latitudes, longitudes, _ = district_listings(listings, "Bourse")
+        listing_index = build_listing_index(np.column_stack((latitudes, longitudes)))
+        for years_to_generate, district_borders, buffer in variants:
+            dir_name = "polygons_bourse_year_district_borders" if district_borders else "polygons_bourse_year_convex_hull"
+            year_point_sets = []
+            year_selections = []
+            for year in years_to_generate:
+                start, end = year_range_rows(listings, "Bourse", year, year)
+                year_point_sets.append(np.column_stack((latitudes[start:end], longitudes[start:end])))
+                year_selections.append(slice(start, end))
+            with profile_stage(profiler, "bourse_year_polygons", district_borders=district_borders, num_years=len(years_to_generate)):
+                year_polygons = generate_phoenix_maps(district_borders, buffer, parameters["num_segments"], parameters["wam_range"], parameters["scale"], parameters["circle_shrink"], year_point_sets, border_points, listing_index, year_selections, parameters["circle_tolerance"], profiler, parameters["wam_kernel"], parameters["density_mode"], parameters["segmentation"], parameters["segment_tolerance"])
+            results += [("{}/{}.json".format(dir_name, year), polygon) for year, polygon in zip(years_to_generate, year_polygons)]
+    return results
+
+# Listings and borders of a generation worker process, set by _init_generation_worker()
+_worker_data = {}
+
+def _init_generation_worker(listings_store_dir, borders, profile):
+    _worker_data["listings"] = open_listings_table(listings_store_dir, mmap_mode="r")
+    _worker_data["borders"] = borders
+    _worker_data["profile"] = profile
+
+def _run_generation_task(task):
+    # Profiling events are collected per task and merged by the parent process
+    function, args = task
+    profiler = create_profiler() if _worker_data["profile"] else None
+    results = function(_worker_data["listings"], _worker_data["borders"], *args, profiler=profiler)
+    return results, [] if profiler is None else profiler["events"]
+
+def setup_and_generate(workers=1, force=False, extra_year_ranges=(), profiler=None):
+    """
+    Load district border and district listing data. Start Phoenixmap generation tasks for outputs whose inputs changed since the last build 
+    and save resulting polygons as json. Outputs no longer generated are removed. All polygons are collected into the binary polygon store read by the app.
+
+    Parameters
+    ----------
+    workers: int
+            Number of worker processes generating Phoenixmaps in parallel, 1 generates sequentially in this process
+    force: bool
+            If True regenerate all polygons regardless of the build manifest
+    extra_year_ranges: list(tuple(int, int))
+            Year ranges (from_year, to_year) to generate for every district in addition to the default ones
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()) collecting per stage timings and counters, also of worker processes
     """
     dir_path =  os.path.dirname(os.path.realpath(__file__))
-    scale = 0.0000000001
-    num_segments = 100
-    wam_range = 10
-    circle_shrink = 0.80
-
-    # 1. Generate Phoenixmaps for the specified year_ranges for every districty
-    with open(os.path.join(dir_path, 'ressources/district_borders.json')) as district_borders:
-        districts = json.load(district_borders).keys()
-
-        for year_range in  [(2009, 2013), (2009, 2017), (2009, 2021), (2013, 2017), (2013, 2021), (2017, 2021), (2009, 2009), (2013, 2013), (2017, 2017), (2021, 2021)]:
-            from_year, to_year = year_range[0], year_range[1]
-
-            # Flush result directory
-            dir_name = os.path.join(dir_path, "../app/ressources/polygons_{}_{}".format(str(year_range[0]), str(year_range[1])))
-            if os.path.exists(dir_name): 
-                shutil.rmtree(dir_name) 
-            os.makedirs(dir_name)
-                
-            for district in districts:
-
-                year_range_points = []
-                with open(os.path.join(dir_path, "ressources/district_listings.json")) as file:
-                    data = json.load(file)
-                    year_range_points = [Point(item['latitude'], item['longitude']) for item in data[district] if from_year <= int(item["host_since"][:4]) <= to_year]
-                    year_range_points = MultiPoint(year_range_points)
-                
-                border_points = []
-                with open(os.path.join(dir_path, "ressources/district_borders.json")) as file:
-                    data = json.load(file)
-                    json_points = [Point(item['latitude'], item['longitude']) for item in data[district]]
-                    border_points = MultiPoint(json_points)
-                
-                district_borders = True
-                buffer = 0
-                polygon = generate_phoenix_map(district_borders, buffer, num_segments, wam_range, scale, circle_shrink, year_range_points, border_points)
-                
-                with open(os.path.join(dir_name, district + ".json"), "w") as district_listings:
-                    json.dump(polygon, district_listings) 
-
-    # 2. Generate Phoenixmaps for specified years for distrct "Bourse"
-
-    # Flush result directories
-    dir_name_convex = os.path.join(dir_path, "../app/ressources/polygons_bourse_year_convex_hull/")
-    if os.path.exists(dir_name_convex): 
-        shutil.rmtree(dir_name_convex) 
-    os.makedirs(dir_name_convex)
-
-    dir_name_borders = os.path.join(dir_path, "../app/ressources/polygons_bourse_year_district_borders/")
-    if os.path.exists(dir_name_borders): 
-        shutil.rmtree(dir_name_borders) 
-    os.makedirs(dir_name_borders)
-
-    for year in [2010, 2011, 2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020]:
-
-        listing_points = []
-        with open(os.path.join(dir_path, "ressources/district_listings.json")) as file:
-            data = json.load(file)
-            year_points = []
-            year_points = [Point(item['latitude'], item['longitude']) for item in data["Bourse"] if int(item["host_since"][:4]) == year]
-            listing_points = MultiPoint(year_points)
-        
-        border_points = []
-        with open(os.path.join(dir_path, "ressources/district_borders.json")) as file:
-            data = json.load(file)
-            json_points = [Point(item['latitude'], item['longitude']) for item in data["Bourse"]]
-            border_points = MultiPoint(json_points)
-
-        # 2.1 Pheonixmap based on convex hull around district 
-        if(len(border_points.geoms) > 3):
-            district_borders = False
-            buffer = 0
-            scale = 0.0000000003
-            polygon = generate_phoenix_map(district_borders, buffer, num_segments, wam_range, scale, circle_shrink, listing_points, border_points)
-            with open(dir_name_convex+"/"+str(year)+".json", "w") as district_listings:
-                json.dump(polygon, district_listings)
-
-        # 2.2 Phoenixmap based on convex hull around district with buffer 0.001
-        if(len(border_points.geoms) > 3):
-            district_borders = True
-            buffer = 0.001
-            scale = 0.0000000003
-            polygon = generate_phoenix_map(district_borders, buffer, num_segments, wam_range, scale, circle_shrink, listing_points, border_points)
-            with open(dir_name_borders+"/"+str(year)+".json", "w") as district_listings:
-                json.dump(polygon, district_listings)
+    output_path = os.path.join(dir_path, "../app/ressources/")
+    manifest_file = os.path.join(output_path, "polygons_manifest.json")
+    # Source files the generated polygons depend on, hashed once for all outputs
+    code_hash = hash_code_files([os.path.join(dir_path, file_name) for file_name in ["phoenixmap_generator.py", "listings_table.py", "polygon_store.py", "build_cache.py"]])
+    parameters = dict(DEFAULT_PARAMETERS)
+    bourse_parameters = dict(parameters, scale=0.0000000003)
+
+    # 0. Load district border and district listing data once
+    with profile_stage(profiler, "load"):
+        borders = load_district_borders(os.path.join(dir_path, "ressources/district_borders.json"))
+        # Listings store written by ingest_listings.py, falls back to district listings json
+        if os.path.exists(os.path.join(dir_path, "ressources/listings_store")):
+            listings = open_listings_table(os.path.join(dir_path, "ressources/listings_store"), mmap_mode=None)
+        else:
+            listings = load_listings_table(os.path.join(dir_path, "ressources/district_listings.json"))
+        # Manifest of the last build, also read with force to remove outputs no longer generated
+        manifest = load_manifest(manifest_file)
+    new_manifest = {}
+
+    # Listings table for the app (year range lookups without parsing the listings json)
+    with profile_stage(profiler, "save_listings_table", num_listings=len(listings["years"])):
+        save_listings_table(listings, os.path.join(output_path, "listings_store"))
+
+    # 1. Phoenixmaps for the specified year_ranges for every districty
+    year_ranges = [(2009, 2013), (2009, 2017), (2009, 2021), (2013, 2017), (2013, 2021), (2017, 2021), (2009, 2009), (2013, 2013), (2017, 2017), (2021, 2021)]
+    year_ranges += [year_range for year_range in map(tuple, extra_year_ranges) if year_range not in year_ranges]
+    tasks = []
+    for district in borders.keys():
+        latitudes, longitudes, _ = district_listings(listings, district)
+        stale_year_ranges = []
+        for from_year, to_year in year_ranges:
+            start, end = year_range_rows(listings, district, from_year, to_year)
+            file_name = "polygons_{}_{}/{}.json".format(from_year, to_year, district)
+            new_manifest[file_name] = compute_cache_key(np.column_stack((latitudes[start:end], longitudes[start:end])), borders[district], (True, 0, sorted(parameters.items())), code_hash)
+            if force or is_stale(manifest, output_path, file_name, new_manifest[file_name]):
+                stale_year_ranges.append((from_year, to_year))
+        if stale_year_ranges:
+            tasks.append((generate_district_polygons, (district, stale_year_ranges, parameters)))
+
+    # 2. Phoenixmaps for specified years for distrct "Bourse"
+    # 2.1 Pheonixmap based on convex hull around district 
+    # 2.2 Phoenixmap based on district border with buffer 0.001
+    bourse_years = [2010, 2011, 2012, 2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020]
+    latitudes, longitudes, _ = district_listings(listings, "Bourse")
+    if len(borders["Bourse"]) > 3:
+        # Both variants run in one task so the Bourse listing index is built once
+        bourse_variants = []
+        for district_borders, buffer, dir_name in [(False, 0, "polygons_bourse_year_convex_hull"), (True, 0.001, "polygons_bourse_year_district_borders")]:
+            stale_years = []
+            for year in bourse_years:
+                start, end = year_range_rows(listings, "Bourse", year, year)
+                file_name = "{}/{}.json".format(dir_name, year)
+                new_manifest[file_name] = compute_cache_key(np.column_stack((latitudes[start:end], longitudes[start:end])), borders["Bourse"], (district_borders, buffer, sorted(bourse_parameters.items())), code_hash)
+                if force or is_stale(manifest, output_path, file_name, new_manifest[file_name]):
+                    stale_years.append(year)
+            if stale_years:
+                bourse_variants.append((stale_years, district_borders, buffer))
+        if bourse_variants:
+            tasks.append((generate_bourse_year_polygons, (bourse_variants, bourse_parameters)))
+
+    # Create result directories, remove outputs of the last build which are no longer generated
+    dir_names = ["polygons_{}_{}".format(from_year, to_year) for from_year, to_year in year_ranges] + ["polygons_bourse_year_convex_hull", "polygons_bourse_year_district_borders"]
+    for dir_name in dir_names:
+        os.makedirs(os.path.join(output_path, dir_name), exist_ok=True)
+    for file_name in manifest.keys() - new_manifest.keys():
+        if os.path.exists(os.path.join(output_path, file_name)):
+            os.remove(os.path.join(output_path, file_name))
+
+    # Run tasks, workers share the listings table through a memory-mapped store instead of pickling it per task
+    with profile_stage(profiler, "generate", num_tasks=len(tasks), workers=workers):
+        if workers > 1 and len(tasks) > 1:
+            with tempfile.TemporaryDirectory() as listings_store_dir:
+                save_listings_table(listings, listings_store_dir)
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_generation_worker, initargs=(listings_store_dir, borders, profiler is not None)) as executor:
+                    task_results = []
+                    for results, events in executor.map(_run_generation_task, tasks):
+                        merge_profile_events(profiler, events)
+                        task_results.append(results)
+        else:
+            task_results = [function(listings, borders, *args, profiler=profiler) for function, args in tasks]
+
+    num_generated = 0
+    with profile_stage(profiler, "write_polygons"):
+        for results in task_results:
+            for file_name, polygon in results:
+                with open(os.path.join(output_path, file_name), "w") as polygon_file:
+                    json.dump(polygon, polygon_file)
+                num_generated += 1
+        save_manifest(manifest_file, new_manifest)
+        write_polygon_store(output_path, new_manifest.keys(), extra_polygons={"district_borders/" + district: border for district, border in borders.items()})
+    record_count(profiler, "generated_polygons", num_generated)
+    print("Generated {} of {} polygons ({} up to date)".format(num_generated, len(new_manifest), len(new_manifest) - num_generated))
 
 if __name__ == "__main__":
-    setup_and_generate()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate Phoenixmap polygons for the app.")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1, sequential)")
+    parser.add_argument("--force", action="store_true", help="regenerate all polygons, even if up to date")
+    parser.add_argument("--year-range", type=int, nargs=2, action="append", default=[], metavar=("FROM", "TO"), help="additional year range to generate for every district (repeatable)")
+    parser.add_argument("--profile", metavar="TRACE_FILE", help="profile generation stages and write a Chrome trace json (chrome://tracing)")
+    parser.add_argument("--profile-log", metavar="LOG_FILE", help="profile generation stages and write a json lines log")
+    args = parser.parse_args()
+
+    profiler = create_profiler() if args.profile or args.profile_log else None
+    setup_and_generate(args.workers, args.force, args.year_range, profiler)
+    if profiler is not None:
+        if args.profile:
+            write_chrome_trace(profiler, args.profile)
+        if args.profile_log:
+            write_profile_log(profiler, args.profile_log)
+        summary = profile_summary(profiler)
+        for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            print("{:<24} {:>8.3f} s {:>8} calls".format(name, stage["seconds"], stage["calls"]))
+        for name, count in sorted(summary["counts"].items()):
+            print("{:<24} {:>10} total".format(name, count["total"]))
@@ -0,0 +1,124 @@
+"""
+On-demand Phoenixmap generation for arbitrary (year range, district, parameter set).
+Results are kept in a bounded LRU cache (sized by polygon vertices), pregenerated polygons of the polygon store serve as warm tier.
+"""
+from cachetools import LRUCache
+
+import numpy as np
+
+import threading
+
+from phoenixmap_generator import phoenix_hull_polygon, build_segment_structure, phoenix_map_from_structure, build_listing_index, DEFAULT_PARAMETERS
+from listings_table import district_listings, year_range_rows
+from polygon_store import store_polygon, simplify_polygon, LOD_TOLERANCES
+from profiling import profile_stage
+
+
+def create_phoenixmap_service(listings, borders, polygon_store=None, max_cached_vertices=2000000, profiler=None):
+    """
+    Creates a Phoenixmap service. The service is thread-safe and can be shared across sessions.
+
+    Parameters
+    ----------
+    listings: dict
+            Listings table (see listings_table.load_listings_table())
+    borders: dict(str, np.ndarray)
+            District border coordinates (see listings_table.load_district_borders())
+    polygon_store: dict
+            Optional polygon store with pregenerated polygons (see polygon_store.open_polygon_store())
+    max_cached_vertices: int
+            Size bound of the cache in polygon vertices (16 bytes each)
+    profiler: dict
+            Optional profiler (see profiling.create_profiler()) recording lookups and generation stages
+
+    Returns
+    ----------
+    dict
+            Service to pass to get_phoenix_map()
+    """
+    return {
+        "listings": listings,
+        "borders": borders,
+        "polygon_store": polygon_store,
+        "cache": LRUCache(maxsize=max_cached_vertices, getsizeof=lambda polygon: 1 if polygon is None else len(polygon)),
+        "listing_indices": {},
+        "segment_structures": {},
+        "lock": threading.Lock(),
+        "profiler": profiler,
+    }
+
+def get_phoenix_map(service, district, from_year, to_year, parameters=None, lod=0):
+    """
+    Returns the Phoenixmap (from district border) of a district for listings with from_year <= host year <= to_year.
+    Served from the cache, from the polygon store (default parameters only) or generated synchronously.
+
+    Parameters
+    ----------
+    service: dict
+            Service as returned by create_phoenixmap_service()
+    district: str
+            Name of the district
+    from_year: int
+            Minimum host year of listings
+    to_year: int
+            Maximum host year of listings
+    parameters: dict
+            Generation parameters (see phoenixmap_generator.DEFAULT_PARAMETERS), missing entries use the defaults
+    lod: int
+            Level of detail tier (see polygon_store.lod_for_zoom()), 0 returns the full resolution polygon
+
+    Returns
+    ----------
+    np.ndarray | None
+            (N, 2) array of polygon coordinates, None if there are no listings in the year range
+    """
+    parameters = dict(DEFAULT_PARAMETERS, **(parameters or {}))
+    key = (district, from_year, to_year, tuple(sorted(parameters.items())), lod)
+    with service["lock"]:
+        if key in service["cache"]:
+            return service["cache"][key]
+
+    # Warm tier: pregenerated polygons
+    store = service["polygon_store"]
+    store_key = "polygons_{}_{}/{}".format(from_year, to_year, district)
+    if parameters == DEFAULT_PARAMETERS and store is not None and store_key in store["polygons"]:
+        polygon = store_polygon(store, store_key, lod)
+    elif lod > 0:
+        # Simplify the full resolution polygon like the generator does for the store
+        polygon = get_phoenix_map(service, district, from_year, to_year, parameters)
+        if polygon is not None:
+            polygon = simplify_polygon(polygon, LOD_TOLERANCES[min(lod, len(LOD_TOLERANCES)) - 1])
+    else:
+        with profile_stage(service["profiler"], "generate_phoenix_map", district=district, from_year=from_year, to_year=to_year):
+            polygon = _generate(service, district, from_year, to_year, parameters)
+
+    with service["lock"]:
+        service["cache"][key] = polygon
+    return polygon
+
+def _generate(service, district, from_year, to_year, parameters):
+    latitudes, longitudes, _ = district_listings(service["listings"], district)
+    with service["lock"]:
+        listing_index = service["listing_indices"].get(district)
+    if listing_index is None:
+        listing_index = build_listing_index(np.column_stack((latitudes, longitudes)))
+        with service["lock"]:
+            service["listing_indices"][district] = listing_index
+
+    start, end = year_range_rows(service["listings"], district, from_year, to_year)
+    if start == end:
+        return None
+    listing_coords = np.column_stack((latitudes[start:end], longitudes[start:end]))
+
+    # Segment structure only depends on the district border, share it between year ranges and density parameters
+    structure_key = (district, parameters["num_segments"], parameters["circle_shrink"], parameters["circle_tolerance"], parameters["segmentation"], parameters["segment_tolerance"])
+    with service["lock"]:
+        structure = service["segment_structures"].get(structure_key)
+    if structure is None:
+        hull_polygon = phoenix_hull_polygon(True, 0, listing_coords, service["borders"][district])
+        structure = build_segment_structure(hull_polygon, parameters["num_segments"], parameters["circle_shrink"], parameters["circle_tolerance"], service["profiler"], parameters["segmentation"], parameters["segment_tolerance"])
+        with service["lock"]:
+            service["segment_structures"][structure_key] = structure
+
+    polygon = phoenix_map_from_structure(structure, parameters["wam_range"], parameters["scale"], listing_coords, listing_index, slice(start, end), service["profiler"], parameters["wam_kernel"], parameters["density_mode"])
+    return np.array(polygon, dtype=np.float64)
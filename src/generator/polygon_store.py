@@ -0,0 +1,193 @@
+"""
+Binary store of generated Phoenixmap polygons. All polygons are kept in a single float64 coordinate buffer (.npy) with a json offset index,
+so the app can memory-map them instead of opening and parsing one json file per polygon.
+Every polygon is also stored in simplified level of detail (LOD) tiers, the app loads the coarsest tier that looks identical at the current map zoom.
+Run as script to rebuild the store from the polygon json files and district borders in app/ressources/.
+"""
+from shapely import *
+import numpy as np
+
+import json
+import math
+import os
+
+# Simplification tolerances (degrees) of LOD tiers 1, 2, ..., tier 0 is the full resolution polygon
+LOD_TOLERANCES = [0.00002, 0.0001, 0.0004]
+
+
+def simplify_polygon(polygon, tolerance):
+    """
+    Simplifies a polygon outline, preserving its topology (no self-intersections are introduced).
+
+    Parameters
+    ----------
+    polygon: np.ndarray
+            (N, 2) array of polygon coordinates
+    tolerance: float
+            Maximum distance of the simplified outline to the original one
+
+    Returns
+    ----------
+    np.ndarray
+            (M, 2) array of simplified polygon coordinates, the original coordinates if simplification degenerates the polygon
+    """
+    simplified = get_coordinates(simplify(Polygon(polygon).exterior, tolerance, preserve_topology=True))
+    return simplified if len(simplified) >= 4 else polygon
+
+def write_polygon_store(output_path, file_names, store_name="polygon_store", extra_polygons=None, lod_tolerances=LOD_TOLERANCES):
+    """
+    Collects generated polygon json files into a binary polygon store. Files are replaced atomically, readers never see a partially written store.
+
+    Parameters
+    ----------
+    output_path: str
+            Directory containing the polygon json files, the store is written there too
+    file_names: list(str)
+            Polygon json files (relative to output_path), e.g. "polygons_2009_2013/Bourse.json"
+    store_name: str
+            File name of the store without extension
+    extra_polygons: dict(str, np.ndarray)
+            Additional polygons by key, e.g. district borders as "district_borders/Bourse"
+    lod_tolerances: list(float)
+            Simplification tolerances of the LOD tiers
+    """
+    polygons = {}
+    for file_name in file_names:
+        with open(os.path.join(output_path, file_name)) as file:
+            polygon = json.load(file)
+        polygons[os.path.splitext(file_name)[0]] = None if polygon is None else np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    polygons.update(extra_polygons or {})
+
+    index = {}
+    lods = {}
+    chunks = []
+    offset = 0
+    for key in sorted(polygons.keys()):
+        polygon = polygons[key]
+        if polygon is None:
+            index[key] = None
+            continue
+        tiers = [polygon]
+        for tolerance in lod_tolerances:
+            tiers.append(simplify_polygon(polygon, tolerance))
+        tier_offsets = []
+        for tier in tiers:
+            tier_offsets.append([offset, offset + len(tier)])
+            chunks.append(tier)
+            offset += len(tier)
+        index[key] = tier_offsets[0]
+        lods[key] = tier_offsets[1:]
+    coords = np.concatenate(chunks) if chunks else np.zeros((0, 2), dtype=np.float64)
+
+    coords_file = os.path.join(output_path, store_name + ".npy")
+    index_file = os.path.join(output_path, store_name + ".json")
+    with open(coords_file + ".tmp", "wb") as file:
+        np.save(file, coords)
+    with open(index_file + ".tmp", "w") as file:
+        json.dump({"polygons": index, "lod_tolerances": list(lod_tolerances), "lods": lods}, file)
+    os.replace(coords_file + ".tmp", coords_file)
+    os.replace(index_file + ".tmp", index_file)
+
+def open_polygon_store(output_path, store_name="polygon_store"):
+    """
+    Opens a binary polygon store, the coordinate buffer is memory-mapped.
+
+    Parameters
+    ----------
+    output_path: str
+            Directory containing the store
+    store_name: str
+            File name of the store without extension
+
+    Returns
+    ----------
+    dict
+            Store with keys "coords" ((N, 2) np.memmap), "polygons" (dict(str, list(int) | None), offsets per polygon key),
+            "lod_tolerances" (list(float)) and "lods" (dict(str, list(list(int))), offsets of the LOD tiers per polygon key)
+    """
+    with open(os.path.join(output_path, store_name + ".json")) as file:
+        index = json.load(file)
+    coords = np.load(os.path.join(output_path, store_name + ".npy"), mmap_mode="r")
+    return {"coords": coords, "polygons": index["polygons"], "lod_tolerances": index.get("lod_tolerances", []), "lods": index.get("lods", {})}
+
+def store_polygon(store, key, lod=0):
+    """
+    Reads a polygon from a polygon store (zero-copy view on the coordinate buffer).
+
+    Parameters
+    ----------
+    store: dict
+            Polygon store as returned by open_polygon_store()
+    key: str
+            Polygon key, e.g. "polygons_2009_2013/Bourse"
+    lod: int
+            LOD tier, 0 reads the full resolution polygon (see lod_for_zoom())
+
+    Returns
+    ----------
+    np.ndarray | None
+            (N, 2) array of polygon coordinates, None if no polygon was generated (no listings)
+    """
+    offsets = store["polygons"][key]
+    if offsets is None:
+        return None
+    if lod > 0 and key in store["lods"]:
+        offsets = store["lods"][key][min(lod, len(store["lods"][key])) - 1]
+    return store["coords"][offsets[0]:offsets[1]]
+
+def lod_for_zoom(zoom, latitude, lod_tolerances=LOD_TOLERANCES):
+    """
+    Selects the coarsest LOD tier whose simplification stays below half a pixel of a web map.
+
+    Parameters
+    ----------
+    zoom: float
+            Web map zoom level
+    latitude: float
+            Latitude of the map center
+    lod_tolerances: list(float)
+            Simplification tolerances of the LOD tiers
+
+    Returns
+    ----------
+    int
+            LOD tier, 0 if no simplified tier is fine enough
+    """
+    # Size of one pixel in degrees (256 pixel tiles, latitude degrees shrink towards the poles)
+    pixel_size = 360 / (256 * 2 ** zoom) * math.cos(math.radians(latitude))
+    lod = 0
+    for i, tolerance in enumerate(lod_tolerances):
+        if tolerance <= pixel_size / 2:
+            lod = i + 1
+    return lod
+
+def store_group(store, group, lod=0):
+    """
+    Lists polygons of a group (one polygons_* directory of the generator), sorted by name.
+
+    Parameters
+    ----------
+    store: dict
+            Polygon store as returned by open_polygon_store()
+    group: str
+            Group name, e.g. "polygons_2009_2013"
+    lod: int
+            LOD tier (see store_polygon())
+
+    Returns
+    ----------
+    list(tuple(str, np.ndarray | None))
+            Polygon name (district/year) and coordinates (see store_polygon())
+    """
+    prefix = group + "/"
+    keys = sorted(key for key in store["polygons"].keys() if key.startswith(prefix))
+    return [(key[len(prefix):], store_polygon(store, key, lod)) for key in keys]
+
+if __name__ == "__main__":
+    from listings_table import load_district_borders
+
+    output_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../app/ressources/")
+    file_names = [os.path.join(dir_name, file_name) for dir_name in sorted(os.listdir(output_path)) if dir_name.startswith("polygons_") and os.path.isdir(os.path.join(output_path, dir_name))
+                  for file_name in sorted(os.listdir(os.path.join(output_path, dir_name))) if file_name.endswith(".json")]
+    borders = load_district_borders(os.path.join(output_path, "district_borders.json"))
+    write_polygon_store(output_path, file_names, extra_polygons={"district_borders/" + district: border for district, border in borders.items()})
@@ -0,0 +1,217 @@
+"""
+Optional stage profiling of Phoenixmap generation and loading. Functions take a profiler (see create_profiler()) or None,
+with None every hook is a no-op, so instrumented code runs at full speed when profiling is disabled.
+Collected stages and counters are exported as Chrome trace json (chrome://tracing, https://ui.perfetto.dev) or as json lines log.
+"""
+from contextlib import contextmanager, nullcontext
+
+import functools
+import json
+import os
+import threading
+import time
+
+# Environment variable enabling the process wide profiler of the app, value is the Chrome trace file to write
+PROFILE_ENV_VAR = "PHOENIXMAP_PROFILE"
+
+_NULL_STAGE = nullcontext()
+_env_profiler = {}
+
+
+def create_profiler():
+    """
+    Creates a profiler collecting stage timings and counters. The profiler is thread-safe.
+
+    Returns
+    ----------
+    dict
+            Profiler to pass to instrumented functions
+    """
+    return {"origin": time.perf_counter(), "events": [], "lock": threading.Lock()}
+
+def profile_stage(profiler, name, **args):
+    """
+    Context manager timing a stage.
+
+    Parameters
+    ----------
+    profiler: dict | None
+            Profiler as returned by create_profiler(), None disables profiling
+    name: str
+            Name of the stage, e.g. "spline_fit"
+    args: dict
+            Additional values stored with the stage (e.g. point counts)
+
+    Returns
+    ----------
+    context manager
+            Stage context, yields a dict which can be updated with values known at the end of the stage
+    """
+    if profiler is None:
+        return _NULL_STAGE
+    return _stage(profiler, name, args)
+
+@contextmanager
+def _stage(profiler, name, args):
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        event = {"type": "stage", "name": name, "start": start, "duration": time.perf_counter() - start, "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+        with profiler["lock"]:
+            profiler["events"].append(event)
+
+def record_count(profiler, name, value):
+    """
+    Records a counter value (e.g. circle shrink iterations).
+
+    Parameters
+    ----------
+    profiler: dict | None
+            Profiler as returned by create_profiler(), None disables profiling
+    name: str
+            Name of the counter
+    value: int | float
+            Counted value
+    """
+    if profiler is None:
+        return
+    event = {"type": "count", "name": name, "start": time.perf_counter(), "value": value, "pid": os.getpid(), "tid": threading.get_ident()}
+    with profiler["lock"]:
+        profiler["events"].append(event)
+
+def merge_profile_events(profiler, events):
+    """
+    Adds events collected by another profiler (e.g. in a worker process) to a profiler.
+
+    Parameters
+    ----------
+    profiler: dict | None
+            Profiler as returned by create_profiler(), None disables profiling
+    events: list(dict)
+            Events of the other profiler
+    """
+    if profiler is None:
+        return
+    with profiler["lock"]:
+        profiler["events"].extend(events)
+
+def profile_summary(profiler):
+    """
+    Aggregates the collected events per stage and counter.
+
+    Parameters
+    ----------
+    profiler: dict
+            Profiler as returned by create_profiler()
+
+    Returns
+    ----------
+    dict
+            "stages" (name -> {"calls", "seconds"}) and "counts" (name -> {"calls", "total"})
+    """
+    stages = {}
+    counts = {}
+    with profiler["lock"]:
+        events = list(profiler["events"])
+    for event in events:
+        if event["type"] == "stage":
+            stage = stages.setdefault(event["name"], {"calls": 0, "seconds": 0.0})
+            stage["calls"] += 1
+            stage["seconds"] += event["duration"]
+        else:
+            count = counts.setdefault(event["name"], {"calls": 0, "total": 0})
+            count["calls"] += 1
+            count["total"] += event["value"]
+    return {"stages": stages, "counts": counts}
+
+def write_chrome_trace(profiler, trace_file):
+    """
+    Writes the collected events as Chrome trace json. Stages become complete events, counters become counter events.
+
+    Parameters
+    ----------
+    profiler: dict
+            Profiler as returned by create_profiler()
+    trace_file: str
+            Path of the trace json
+    """
+    with profiler["lock"]:
+        events = list(profiler["events"])
+    trace_events = []
+    for event in events:
+        # perf_counter is monotonic system wide, so events of worker processes share the time base
+        timestamp = (event["start"] - profiler["origin"]) * 1e6
+        if event["type"] == "stage":
+            trace_events.append({"name": event["name"], "ph": "X", "ts": timestamp, "dur": event["duration"] * 1e6, "pid": event["pid"], "tid": event["tid"], "args": event["args"]})
+        else:
+            trace_events.append({"name": event["name"], "ph": "C", "ts": timestamp, "pid": event["pid"], "tid": event["tid"], "args": {event["name"]: event["value"]}})
+    with open(trace_file + ".tmp", "w") as file:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, file)
+    os.replace(trace_file + ".tmp", trace_file)
+
+def write_profile_log(profiler, log_file):
+    """
+    Writes the collected events as json lines log, one event per line with time relative to profiler creation in seconds.
+
+    Parameters
+    ----------
+    profiler: dict
+            Profiler as returned by create_profiler()
+    log_file: str
+            Path of the log file
+    """
+    with profiler["lock"]:
+        events = list(profiler["events"])
+    with open(log_file, "w") as file:
+        for event in events:
+            file.write(json.dumps(dict(event, start=event["start"] - profiler["origin"]), default=str) + "\n")
+
+def env_profiler():
+    """
+    Returns the process wide profiler of the app, enabled by setting the environment variable PHOENIXMAP_PROFILE to a trace file.
+
+    Returns
+    ----------
+    dict | None
+            Profiler, None if profiling is disabled
+    """
+    if PROFILE_ENV_VAR not in os.environ:
+        return None
+    if "profiler" not in _env_profiler:
+        _env_profiler.setdefault("profiler", create_profiler())
+    return _env_profiler["profiler"]
+
+def write_env_profile():
+    """
+    Writes the Chrome trace of the process wide profiler of the app to the file named by PHOENIXMAP_PROFILE, no-op if profiling is disabled.
+    """
+    profiler = env_profiler()
+    if profiler is not None:
+        write_chrome_trace(profiler, os.environ[PROFILE_ENV_VAR])
+
+def profiled_loader(name):
+    """
+    Decorator recording every call of a loader as stage of the process wide profiler of the app (see env_profiler()).
+    Loaders are returned unchanged if profiling is disabled. Place below st.cache_resource() to record cache misses only.
+
+    Parameters
+    ----------
+    name: str
+            Name of the stage
+
+    Returns
+    ----------
+    callable
+            Decorator
+    """
+    def decorate(function):
+        if env_profiler() is None:
+            return function
+
+        @functools.wraps(function)
+        def profiled_function(*args, **kwargs):
+            with profile_stage(env_profiler(), name):
+                return function(*args, **kwargs)
+        return profiled_function
+    return decorate
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Generator modules import each other as top level modules (see phoenixmap_generator.py)
+generator_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if generator_path not in sys.path:
+    sys.path.insert(0, generator_path)
@@ -0,0 +1,23 @@
+import os
+
+import numpy as np
+import pytest
+from shapely import Polygon, is_valid
+
+from listings_table import load_district_borders
+from phoenixmap_generator import DEFAULT_PARAMETERS, phoenix_hull_polygon, fit_bspline_segments, fit_segment_circles
+from benchmark import MIN_CIRCLE_RADIUS, generate_border
+
+BORDERS_FILE = os.path.join(os.path.dirname(__file__), "..", "ressources", "district_borders.json")
+BORDERS = load_district_borders(BORDERS_FILE)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_generated_border_has_non_degenerate_circles(seed):
+    border, district = generate_border(np.random.default_rng(seed), BORDERS)
+    segments = fit_bspline_segments(phoenix_hull_polygon(True, 0, None, border), DEFAULT_PARAMETERS["num_segments"])
+    circle_radii, _ = fit_segment_circles(segments, DEFAULT_PARAMETERS["circle_shrink"])
+
+    assert district in BORDERS
+    assert border.shape == (200, 2)
+    assert is_valid(Polygon(border))
+    assert np.median(circle_radii) > 100 * MIN_CIRCLE_RADIUS
@@ -0,0 +1,24 @@
+import os
+
+import numpy as np
+import pytest
+
+from listings_table import load_district_borders
+from phoenixmap_generator import DEFAULT_PARAMETERS, phoenix_hull_polygon, fit_bspline_segments, fit_inscribed_circles, shrink_inscribed_circles
+
+BORDERS_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "app", "ressources", "district_borders.json")
+BORDERS = load_district_borders(BORDERS_FILE)
+MIN_RADIUS = 0.0000005
+
+@pytest.mark.parametrize("district", sorted(BORDERS))
+def test_bisection_radii_not_smaller_than_shrink_radii(district):
+    segments = fit_bspline_segments(phoenix_hull_polygon(True, 0.001, None, BORDERS[district]), DEFAULT_PARAMETERS["num_segments"])
+    arguments = (segments["bspline_polygon"], segments["midpoints"], segments["normals"], segments["max_radii"])
+    shrink_radii, _ = shrink_inscribed_circles(*arguments, DEFAULT_PARAMETERS["circle_shrink"], MIN_RADIUS)
+    tolerance = 0.0000001
+    bisection_radii, bisection_centers = fit_inscribed_circles(*arguments, tolerance, MIN_RADIUS)
+
+    assert np.all(bisection_radii >= shrink_radii - tolerance)
+    assert np.all(bisection_radii <= segments["max_radii"])
+    assert np.count_nonzero(bisection_radii <= MIN_RADIUS) <= np.count_nonzero(shrink_radii <= MIN_RADIUS)
+    assert np.allclose(bisection_centers, segments["midpoints"] + segments["normals"] * bisection_radii[:, np.newaxis])
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import pytest
+from shapely import Polygon, MultiPolygon, is_valid, make_valid
+
+from listings_table import load_district_borders
+from phoenixmap_generator import DEFAULT_PARAMETERS, phoenix_hull_polygon, build_segment_structure, build_listing_index, compute_segment_densities, average_segment_densities, remove_outline_loops
+
+BORDERS_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "app", "ressources", "district_borders.json")
+BORDERS = load_district_borders(BORDERS_FILE)
+
+def inner_outline(district, density_scale, num_segments, seed):
+    # Inner outline as built by build_phoenix_outline() for normally distributed listings around the district
+    border_points = BORDERS[district]
+    listing_points = np.random.default_rng(seed).normal(border_points.mean(axis=0), border_points.std(axis=0), size=(5000, 2))
+    structure = build_segment_structure(phoenix_hull_polygon(True, 0, None, border_points), num_segments, DEFAULT_PARAMETERS["circle_shrink"])
+    rectangle_densities = compute_segment_densities(structure, build_listing_index(listing_points))
+    wam_segment_densities = average_segment_densities(rectangle_densities, structure["rectangle_areas"], DEFAULT_PARAMETERS["wam_range"])
+    corner_points = structure["midpoints"][::-1] + structure["normals"][::-1] * (wam_segment_densities[::-1] * density_scale)[:, np.newaxis]
+    return corner_points[:-1]
+
+def largest_polygon_area(ring):
+    polygon = make_valid(Polygon(ring))
+    if type(polygon) == MultiPolygon:
+        return max(part.area for part in polygon.geoms)
+    return polygon.area
+
+@pytest.mark.parametrize("num_segments", [100, 200])
+@pytest.mark.parametrize("density_scale", [0.0000000001, 0.0000000003, 0.000000001])
+@pytest.mark.parametrize("district", sorted(BORDERS))
+def test_removed_loops_keep_largest_polygon(district, density_scale, num_segments):
+    outline = inner_outline(district, density_scale, num_segments, seed=0)
+    ring = remove_outline_loops(outline)
+
+    assert ring[0] == ring[-1]
+    assert is_valid(Polygon(ring))
+    assert Polygon(ring).area >= 0.99 * largest_polygon_area(outline)
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pytest
+
+from listings_table import load_district_borders
+from phoenixmap_generator import DEFAULT_PARAMETERS, phoenix_hull_polygon, build_segment_structure, build_listing_index, compute_segment_densities, compute_projection_densities, average_segment_densities
+
+BORDERS_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "app", "ressources", "district_borders.json")
+BORDERS = load_district_borders(BORDERS_FILE)
+NUM_LISTINGS = 50000
+# Projection and rectangle densities of uniform listings agree within 15% after averaging
+DENSITY_TOLERANCE = 0.15
+
+@pytest.mark.parametrize("district", sorted(BORDERS))
+def test_projection_densities_match_rectangle_densities(district):
+    border = BORDERS[district]
+    structure = build_segment_structure(phoenix_hull_polygon(True, 0, None, border), DEFAULT_PARAMETERS["num_segments"], DEFAULT_PARAMETERS["circle_shrink"])
+    listings = np.random.default_rng(0).uniform(border.min(axis=0), border.max(axis=0), size=(NUM_LISTINGS, 2))
+    rectangle_densities = compute_segment_densities(structure, build_listing_index(listings))
+    projection_densities = compute_projection_densities(structure, listings)
+
+    radii = structure["circle_radii"]
+    compared = (np.minimum(radii[:-1], radii[1:]) > 0.0001) & (rectangle_densities > 0)
+    ratios = projection_densities[compared] / rectangle_densities[compared]
+    assert abs(np.median(ratios) - 1) <= 0.05
+
+    averaging_range = DEFAULT_PARAMETERS["wam_range"]
+    averaged_rectangle = average_segment_densities(rectangle_densities, structure["rectangle_areas"], averaging_range)
+    averaged_projection = average_segment_densities(projection_densities, structure["rectangle_areas"], averaging_range)
+    assert np.all(np.abs(averaged_projection / averaged_rectangle - 1) <= DENSITY_TOLERANCE)